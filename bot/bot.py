@@ -4,12 +4,15 @@ Telegram bot for monitoring and controlling the mirror process
 
 import asyncio
 import os
+import traceback
 from typing import Optional
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
+from telethon import TelegramClient
 
-from core.config import Config
+from core.config import Config, TELEGRAM_CLIENT_OPTIONS
 from core.processor import MirrorProcessor
+from core.utils import clean_channel_link, format_size
 
 
 class MirrorBot:
@@ -19,9 +22,21 @@ class MirrorBot:
         self.config = config
         self.bot: Optional[Client] = None
         self.processor: Optional[MirrorProcessor] = None
-        self.is_running = False
+        # Held for the whole mirror run; atomic across concurrently dispatched handlers
+        self._mirror_lock = asyncio.Lock()
         self.current_task: Optional[asyncio.Task] = None
         
+        # Telethon client kept alive across /mirror runs (connected on first use,
+        # disconnected in stop()), plus resolved channels keyed by link
+        self._tg_client: Optional[TelegramClient] = None
+        self._entity_cache: dict = {}
+        
+        # Processor progress events, coalesced into one status edit per batch
+        # (every _progress_batch_size events or _progress_interval seconds)
+        self._progress_q: asyncio.Queue = asyncio.Queue(maxsize=256)
+        self._progress_interval = 2.0
+        self._progress_batch_size = 100
+        
     def initialize(self):
         """Initialize the bot client."""
         if not self.config.bot_token:
@@ -41,6 +56,13 @@ class MirrorBot:
             bot_token=self.config.bot_token
         )
         
+        self._tg_client = TelegramClient(
+            self.config.session_file,
+            self.config.api_id,
+            self.config.api_hash,
+            **TELEGRAM_CLIENT_OPTIONS
+        )
+        
         # Register handlers
         self._register_handlers()
         
@@ -67,21 +89,19 @@ class MirrorBot:
         @self.bot.on_message(filters.command("mirror") & filters.private)
         async def mirror_command(client: Client, message: Message):
             """Start mirroring command."""
-            if self.is_running:
-                await message.reply_text("⚠️ Mirror process is already running!")
-                return
-            
             # Get channel from command or use configured one
             command_parts = message.text.split()
             channel = self.config.channel_link
             
             if len(command_parts) > 1:
-                channel = command_parts[1].strip()
-                # Clean channel link
-                if channel.startswith('https://t.me/'):
-                    channel = '@' + channel.split('/')[-1]
-                elif not channel.startswith('@'):
-                    channel = '@' + channel
+                channel = clean_channel_link(command_parts[1])
+                if not channel:
+                    await message.reply_text(
+                        f"❌ Invalid channel: {command_parts[1]}\n\n"
+                        "Usage: `/mirror @channelname` or `/mirror https://t.me/channelname`",
+                        parse_mode="markdown"
+                    )
+                    return
             
             if not channel:
                 await message.reply_text(
@@ -92,18 +112,34 @@ class MirrorBot:
                 )
                 return
             
-            self.config.channel_link = channel
+            # Claim the run slot - no await between this check and acquire(), so two
+            # /mirror commands arriving together can't both start a run
+            if self._mirror_lock.locked():
+                await message.reply_text("⚠️ Mirror process is already running!")
+                return
+            await self._mirror_lock.acquire()
             
-            # Start mirroring in background
-            await message.reply_text(f"🚀 Starting mirror for {channel}...")
-            self.is_running = True
+            try:
+                self.config.channel_link = channel
+                
+                # Start mirroring in background
+                status_message = await message.reply_text(f"🚀 Starting mirror for {channel}...")
+            except BaseException:
+                self._mirror_lock.release()
+                raise
             
             # Create processor and set progress callback
-            self.processor = MirrorProcessor(self.config)
+            self.processor = MirrorProcessor(
+                self.config,
+                client=self._tg_client,
+                entity_cache=self._entity_cache
+            )
             self.processor.set_progress_callback(self._progress_callback)
             
             # Run in background
-            self.current_task = asyncio.create_task(self._run_mirror(message))
+            self.current_task = asyncio.create_task(self._run_mirror(message, status_message))
+            # Release in a done-callback so a task cancelled before it starts still frees the slot
+            self.current_task.add_done_callback(lambda _: self._mirror_lock.release())
         
         @self.bot.on_message(filters.command("status") & filters.private)
         async def status_command(client: Client, message: Message):
@@ -131,13 +167,7 @@ class MirrorBot:
                 await message.reply_text("ℹ️ No mirror process running.")
                 return
             
-            # Cancel task if running
-            if self.current_task:
-                self.current_task.cancel()
-            
-            self.is_running = False
-            if self.processor:
-                self.processor.cleanup()
+            await self._cancel_current_task()
             
             await message.reply_text("🛑 Mirror process stopped.")
         
@@ -160,37 +190,106 @@ class MirrorBot:
             )
             await message.reply_text(help_text)
     
-    async def _progress_callback(self, event: str, **kwargs):
-        """Progress callback for processor updates."""
-        # This can be used to send progress updates to Telegram
-        # For now, we'll just log it
-        print(f"[Bot Progress] {event}: {kwargs}")
+    @property
+    def is_running(self) -> bool:
+        """Whether a mirror run currently holds the run lock."""
+        return self._mirror_lock.locked()
     
-    async def _run_mirror(self, start_message: Message):
-        """Run the mirror process."""
-        import concurrent.futures
-        
+    def _progress_callback(self, event: str, **kwargs):
+        """
+        Progress callback for processor updates.
+        Only queues the event; _drain_progress turns bursts of events into a
+        single status message edit so we stay well under Telegram's rate limits.
+        """
         try:
-            # Run processor in thread executor since it uses sync Telethon
-            loop = asyncio.get_event_loop()
-            executor = concurrent.futures.ThreadPoolExecutor()
-            
-            # Initialize in executor
-            init_success = await loop.run_in_executor(
-                executor,
-                self.processor.initialize
+            self._progress_q.put_nowait((event, kwargs))
+        except asyncio.QueueFull:
+            # Drop the oldest event - only the latest state is shown anyway
+            self._progress_q.get_nowait()
+            self._progress_q.put_nowait((event, kwargs))
+    
+    def _format_progress(self, events: list) -> str:
+        """Build one status text from a batch of progress events (latest wins)."""
+        event, info = events[-1]
+        
+        # Aggregate the batch in one pass
+        completed = skipped = failed = batch_bytes = 0
+        for name, data in events:
+            if name == "completed":
+                completed += 1
+                batch_bytes += data.get('size') or 0
+            elif name == "skipped":
+                skipped += 1
+            elif name == "failed":
+                failed += 1
+        
+        lines = [f"🔄 **Mirroring {self.config.channel_link}**\n"]
+        if 'current' in info:
+            lines.append(f"[{info['current']}/{info.get('total') or '?'}] {event}: {info.get('filename', '')}")
+        elif 'error' in info:
+            lines.append(f"❌ Error: {info['error']}")
+        else:
+            lines.append(f"{event}")
+        if completed or skipped or failed:
+            lines.append(
+                f"Since last update: +{completed} done ({format_size(batch_bytes)}), "
+                f"+{skipped} skipped, +{failed} failed"
             )
+        if self.processor:
+            lines.append(
+                f"✓ Downloaded: {self.processor.downloaded_count}\n"
+                f"⊘ Skipped: {self.processor.skipped_count}\n"
+                f"✗ Failed: {self.processor.failed_count}"
+            )
+        return "\n".join(lines)
+    
+    async def _drain_progress(self, status_message: Message):
+        """
+        Collapse queued progress events into one status edit.
+        A batch is flushed after _progress_batch_size events or _progress_interval
+        seconds from its first event, whichever comes first.
+        """
+        loop = asyncio.get_running_loop()
+        last_text = None
+        while True:
+            events = [await self._progress_q.get()]
+            deadline = loop.time() + self._progress_interval
+            while len(events) < self._progress_batch_size:
+                try:
+                    events.append(self._progress_q.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    events.append(await asyncio.wait_for(self._progress_q.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            text = self._format_progress(events)
+            if text == last_text:
+                continue
+            try:
+                await status_message.edit_text(text)
+                last_text = text
+            except Exception as e:
+                print(f"[Bot Progress] Could not update status: {str(e)}")
+    
+    async def _run_mirror(self, start_message: Message, status_message: Message):
+        """Run the mirror process."""
+        self._progress_q = asyncio.Queue(maxsize=256)  # Fresh queue per run
+        drain_task = asyncio.create_task(self._drain_progress(status_message))
+        try:
+            # Telethon runs natively on the bot's event loop
+            init_success = await self.processor.initialize()
             
             if not init_success:
                 await start_message.reply_text("❌ Failed to initialize. Check your configuration.")
-                self.is_running = False
                 return
             
-            # Run processing in executor
-            success = await loop.run_in_executor(
-                executor,
-                self.processor.process_channel
-            )
+            success = await self.processor.process_channel()
             
             if success:
                 await start_message.reply_text(
@@ -206,17 +305,30 @@ class MirrorBot:
             await start_message.reply_text("🛑 Mirror process was cancelled.")
         except Exception as e:
             await start_message.reply_text(f"❌ Error: {str(e)}")
-            import traceback
             traceback.print_exc()
         finally:
+            drain_task.cancel()
             if self.processor:
-                # Cleanup in executor
-                loop = asyncio.get_event_loop()
-                executor = concurrent.futures.ThreadPoolExecutor()
-                await loop.run_in_executor(executor, self.processor.cleanup)
-            self.is_running = False
+                await self.processor.cleanup()
             self.current_task = None
     
+    async def _cancel_current_task(self, timeout: float = 5.0):
+        """
+        Cancel the running mirror task and wait for it to unwind, so its own
+        cleanup finishes before the caller touches the processor or client.
+        """
+        task = self.current_task
+        if not task:
+            return
+        task.cancel()
+        try:
+            await asyncio.wait_for(task, timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            print(f"⚠️ Mirror task ended with error: {str(e)}")
+        self.current_task = None
+    
     # Note: Bot is started via bot.bot.run() in run_bot.py
     # This method is kept for compatibility but not used
     async def start(self):
@@ -225,6 +337,10 @@ class MirrorBot:
     
     async def stop(self):
         """Stop the bot."""
-        if self.bot:
+        await self._cancel_current_task()
+        if self.bot and self.bot.is_connected:
             await self.bot.stop()
+        if self._tg_client:
+            await self._tg_client.disconnect()
+            self.config.backup_session()
 
@@ -6,7 +6,7 @@ from .config import Config
 from .downloader import TelegramDownloader
 from .uploader import DriveUploader
 from .processor import MirrorProcessor
-from .utils import format_size, has_media, get_file_info, calculate_file_hash
+from .utils import format_size, has_media, get_file_info, calculate_file_hash, clean_channel_link
 from .logger import MirrorLogger
 
 __all__ = [
@@ -18,6 +18,7 @@ __all__ = [
     'has_media',
     'get_file_info',
     'calculate_file_hash',
+    'clean_channel_link',
     'MirrorLogger',
 ]
 
@@ -3,6 +3,9 @@ Configuration management for the mirror script
 """
 
 import os
+import json
+import shutil
+from functools import cached_property
 from typing import Optional
 
 # Try to import Colab-specific modules
@@ -12,6 +15,16 @@ try:
 except ImportError:
     IS_COLAB = False
 
+# Telethon connection settings shared by every TelegramClient we build: retry
+# dropped connections quickly rather than reconnecting from scratch, and sleep
+# through short FloodWaits inside the request instead of failing it
+TELEGRAM_CLIENT_OPTIONS = {
+    'connection_retries': 5,
+    'retry_delay': 1,
+    'request_retries': 5,
+    'flood_sleep_threshold': 60,
+}
+
 
 class Config:
     """Configuration class for managing settings."""
@@ -27,6 +40,24 @@ class Config:
         self.channel_link: Optional[str] = None
         self.folder_name: Optional[str] = None
         self.reverse_order: bool = False
+        # Page the whole channel history even when an earlier run left a resume point
+        self.full_rescan: bool = os.getenv('FULL_RESCAN', 'false').lower() == 'true'
+        
+        # Number of files downloaded/uploaded at the same time
+        self.max_concurrent_downloads: int = 4
+        # Concurrent GetFile streams per large file (one shared connection);
+        # Telegram starts refusing requests beyond ~4
+        self.download_streams: int = 4
+        # Files copied into Drive at the same time
+        self.max_concurrent_uploads: int = 2
+        # Files smaller than this (MB) are downloaded straight into Drive instead
+        # of to temp and then copied across; 0 turns that off
+        self.small_file_bypass_mb: int = 50
+        # List the Drive folder via the Drive API (needs google-api-python-client
+        # and credentials) instead of the much slower mount, for the resume check
+        self.drive_api_listing: bool = os.getenv('DRIVE_API_LISTING', 'false').lower() == 'true'
+        # Drive file fields to set on the target folder (DRIVE_FOLDER_METADATA, JSON)
+        self.drive_folder_metadata: Optional[dict] = None
         
         # Bot settings (optional)
         self.bot_token: Optional[str] = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -57,13 +88,19 @@ class Config:
                     return False, f"Cannot create temp directory: {str(e)}"
             
             # Check drive base path
-            if not os.path.exists(self.drive_base_path):
-                return False, f"Drive base path does not exist: {self.drive_base_path}"
-            
-            if not os.access(self.drive_base_path, os.W_OK):
-                return False, f"Drive base path is not writable: {self.drive_base_path}"
+            error = self._check_drive_base_path()
+            if error:
+                return False, f"Drive base path {error}"
         
         return True, None
+    
+    def _check_drive_base_path(self) -> Optional[str]:
+        """Return why drive_base_path is unusable, or None if it exists and is writable."""
+        if not os.path.exists(self.drive_base_path):
+            return f"does not exist: {self.drive_base_path}"
+        if not os.access(self.drive_base_path, os.W_OK):
+            return f"is not writable: {self.drive_base_path}"
+        return None
         
     def load_from_env(self):
         """Load configuration from environment variables."""
@@ -81,6 +118,43 @@ class Config:
         reverse = os.getenv('DOWNLOAD_REVERSE', 'false').lower()
         self.reverse_order = reverse == 'true'
         
+        concurrency = os.getenv('MAX_CONCURRENT_DOWNLOADS')
+        if concurrency:
+            try:
+                self.max_concurrent_downloads = max(1, int(concurrency))
+            except ValueError:
+                pass
+        
+        streams = os.getenv('TELEGRAM_DL_WORKERS')
+        if streams:
+            try:
+                self.download_streams = max(1, int(streams))
+            except ValueError:
+                pass
+        
+        uploads = os.getenv('DRIVE_UPLOAD_WORKERS')
+        if uploads:
+            try:
+                self.max_concurrent_uploads = max(1, int(uploads))
+            except ValueError:
+                pass
+        
+        bypass_mb = os.getenv('SMALL_FILE_BYPASS_MB')
+        if bypass_mb:
+            try:
+                self.small_file_bypass_mb = max(0, int(bypass_mb))
+            except ValueError:
+                pass
+        
+        folder_metadata = os.getenv('DRIVE_FOLDER_METADATA')
+        if folder_metadata:
+            try:
+                metadata = json.loads(folder_metadata)
+            except ValueError:
+                metadata = None
+            if isinstance(metadata, dict) and metadata:
+                self.drive_folder_metadata = metadata
+        
         user_id = os.getenv('TELEGRAM_USER_ID')
         if user_id:
             try:
@@ -94,10 +168,16 @@ class Config:
             self.folder_name = 'Telegram_Mirror'
         return os.path.join(self.drive_base_path, self.folder_name)
     
-    def get_session_file(self) -> str:
+    def get_drive_api_folder(self) -> str:
+        """Target folder path relative to My Drive, for Drive API lookups (DRIVE_BASE_PATH must be My Drive)."""
+        return os.path.relpath(self.get_drive_folder_path(), self.drive_base_path)
+    
+    @cached_property
+    def session_file(self) -> str:
         """
-        Get the path to the Telegram session file.
+        Path to the Telegram session file.
         Uses a persistent location (home directory or current directory) instead of temp.
+        Computed (and its directory created) once per Config.
         """
         if self.is_colab:
             # In Colab, use /content (persists across restarts if runtime is kept)
@@ -110,7 +190,44 @@ class Config:
         session_dir = os.path.join(session_dir, '.tg_mirror')
         os.makedirs(session_dir, exist_ok=True)
         
-        return os.path.join(session_dir, 'telegram_session')
+        session_file = os.path.join(session_dir, 'telegram_session')
+        if self.is_colab:
+            # A reset runtime starts with an empty /content: bring back the copy
+            # kept in Drive, so we don't log in (and redo DC auth exports) again
+            backup = self._session_backup_path()
+            if not os.path.exists(session_file + '.session') and os.path.exists(backup):
+                try:
+                    shutil.copyfile(backup, session_file + '.session')
+                    print("✓ Restored Telegram session from Drive")
+                except OSError as e:
+                    print(f"⚠️ Could not restore session from Drive: {str(e)}")
+        return session_file
+    
+    def _session_backup_path(self) -> str:
+        """Path of the session copy kept in Drive (Colab only)."""
+        return os.path.join(self.drive_base_path, '.tg_mirror', 'telegram_session.session')
+    
+    def backup_session(self):
+        """
+        Copy the session file to Drive so it survives a Colab runtime reset.
+        Call after the client has disconnected, so the SQLite file is settled.
+        The session itself stays on local disk: SQLite on the Drive mount is slow.
+        """
+        if not self.is_colab:
+            return
+        session_path = self.session_file + '.session'
+        if not os.path.exists(session_path):
+            return
+        backup = self._session_backup_path()
+        try:
+            os.makedirs(os.path.dirname(backup), exist_ok=True)
+            shutil.copyfile(session_path, backup)
+        except OSError as e:
+            print(f"⚠️ Could not back up session to Drive: {str(e)}")
+    
+    def get_session_file(self) -> str:
+        """Get the path to the Telegram session file (see session_file)."""
+        return self.session_file
     
     def mount_drive(self) -> bool:
         """Check if Google Drive is mounted (should be mounted in Colab notebook cell)."""
@@ -127,11 +244,9 @@ class Config:
                 return False
         else:
             # Validate that drive path exists and is writable
-            if not os.path.exists(self.drive_base_path):
-                print(f"✗ Drive path does not exist: {self.drive_base_path}")
-                return False
-            if not os.access(self.drive_base_path, os.W_OK):
-                print(f"✗ Drive path is not writable: {self.drive_base_path}")
+            error = self._check_drive_base_path()
+            if error:
+                print(f"✗ Drive path {error}")
                 return False
             print("✓ Drive path is accessible")
             return True
@@ -5,272 +5,592 @@ Telegram downloader module with FloodWait handling
 import os
 import sys
 import time
+import random
 import asyncio
-import threading
 from typing import Optional
 from telethon import TelegramClient
 from telethon.errors import FloodWaitError
-from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+from telethon.tl.types import (
+    MessageMediaPhoto, InputPhotoFileLocation, PhotoSize, PhotoSizeProgressive
+)
 
-from .utils import has_media, get_file_info, format_size
+from .utils import has_media, get_file_info, format_size, new_hash
+
+# Retry policy: seconds to wait after the Nth timeout/connection failure,
+# the delay after any other error, and the longest FloodWait we sleep through
+_BACKOFF_SCHEDULE = (10, 20, 30, 60, 120)
+_ERROR_RETRY_DELAY = 5
+_FLOOD_WAIT_CAP = 3600
+_RETRY_JITTER = 0.2  # Up to +20% on every wait so workers don't retry in lockstep
+
+# FloodWait governor: each FloodWait takes one transfer slot out of service
+# (never below one) and hands it back after this many seconds
+_PERMIT_RECOVERY_DELAY = 60
+
+# Progress line pieces, encoded once (the bar glyphs are 3 bytes each in UTF-8)
+_BAR_LENGTH = 30
+_BAR_FULL = ('█' * _BAR_LENGTH).encode('utf-8')
+_BAR_EMPTY = ('░' * _BAR_LENGTH).encode('utf-8')
+_BAR_GLYPH_BYTES = len('█'.encode('utf-8'))
+_PROGRESS_PREFIX = '\r  📥 ['.encode('utf-8')
+_INV_MIB = 1.0 / (1024 * 1024)
+_PROGRESS_INTERVAL = 0.5  # Seconds between progress line redraws
+
+# Large documents are fetched as several concurrent GetFile request streams,
+# each writing its own slice of the file. They all go over the one sender
+# Telethon keeps per DC (not a connection each): the gain is more requests in
+# flight, which Telegram throttles per stream and starts refusing past 3-4
+_PARALLEL_MIN_SIZE = 20 * 1024 * 1024
+_PARALLEL_STREAMS = 4
+_PART_SIZE = 512 * 1024  # Largest GetFile request Telegram allows
+
+# Userspace write buffer for single-stream downloads (Python's default is 8 KiB),
+# sized to the file between these bounds
+_WRITE_BUFFER_SIZE = 2 * 1024 * 1024
+_MIN_WRITE_BUFFER_SIZE = 64 * 1024
+
+
+class _DownloadState:
+    """Progress bookkeeping for a single in-flight download."""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.start_time = time.monotonic()
+        self.last_progress_bytes = 0
+        self.last_progress_time = self.start_time
+        # Reciprocal of the total size, computed once instead of dividing per chunk
+        self.total_bytes = 0
+        self.inv_total = 0.0
+    
+    def set_total(self, total_bytes: int):
+        """Record the download's total size and its reciprocal."""
+        self.total_bytes = total_bytes
+        self.inv_total = 1.0 / total_bytes
+
+
+class _HashingWriter:
+    """File wrapper that MD5s each chunk Telethon writes through it."""
+    
+    def __init__(self, f):
+        self._f = f
+        self._hash = new_hash('md5')
+        self.tell = f.tell
+        self.flush = f.flush
+    
+    def write(self, data) -> int:
+        self._hash.update(data)
+        return self._f.write(data)
+    
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
 
 
 class TelegramDownloader:
     """Handles downloading files from Telegram with retry logic."""
     
-    def __init__(self, client: TelegramClient, temp_dir: str):
+    def __init__(self, client: TelegramClient, temp_dir: str, max_concurrency: int = 1,
+                 streams: int = _PARALLEL_STREAMS):
         self.client = client
         self.temp_dir = temp_dir
-        self._resume_offset = 0  # Track bytes already downloaded for resume
+        self.streams = max(1, streams)  # Concurrent GetFile streams per large document
+        # Transfer slots; shrinks on FloodWait and recovers one slot at a time
+        self._permits = asyncio.Semaphore(max_concurrency)
+        self._permit_limit = max_concurrency
+        self._governor_tasks = set()
+        # Next free suffix per (stem, ext) so repeated names don't re-probe from 0
+        self._next_suffix = {}
+        # In-flight downloads (insertion-ordered set) and the task drawing them
+        self._active = {}
+        self._renderer: Optional[asyncio.Task] = None
+        self._last_line_len = 0
+        # MD5 of finished single-stream downloads, by temp path (see pop_file_hash)
+        self._file_hashes = {}
     
-    def _progress_callback(self, downloaded_bytes: int, total_bytes: int):
+    def pop_file_hash(self, temp_file_path: str) -> Optional[str]:
         """
-        Progress callback for download updates.
-        Note: When resuming, Telethon's downloaded_bytes is relative to the resume point,
-        so we add _resume_offset to get the total downloaded bytes.
+        Take the MD5 computed while a file was downloaded.
+        
+        Returns:
+            Hex digest, or None if the file was fetched in parallel slices
+            (written out of order, so not hashed on the way in)
         """
-        if total_bytes and total_bytes > 0:
-            # Add resume offset to get total downloaded (Telethon's callback is relative to resume point)
-            total_downloaded = self._resume_offset + downloaded_bytes
-            percent = (total_downloaded / total_bytes) * 100
-            downloaded_mb = total_downloaded / (1024 * 1024)
-            total_mb = total_bytes / (1024 * 1024)
-            # Show progress with a simple progress bar
-            bar_length = 30
-            filled = int(bar_length * total_downloaded // total_bytes)
-            bar = '█' * filled + '░' * (bar_length - filled)
-            # Use sys.stdout.write for better control in Colab/Jupyter
-            # Only show if monitor thread isn't active (to avoid conflicts)
-            if not hasattr(self, '_monitor_active') or not self._monitor_active:
-                sys.stdout.write(f"\r  📥 [{bar}] {percent:.1f}% ({downloaded_mb:.1f} MB / {total_mb:.1f} MB)")
-                sys.stdout.flush()
-            self._last_progress_bytes = total_downloaded
-            self._last_progress_time = time.time()
+        return self._file_hashes.pop(temp_file_path, None)
     
-    def _monitor_file_size(self, file_path: str, total_size: int, stop_event: threading.Event):
-        """Monitor file size and show progress if callback isn't working."""
-        last_size = 0
-        last_update = time.time()
-        stalled_count = 0
+    def _reserve_temp_path(self, filename: str) -> str:
+        """
+        Atomically reserve a unique temp path for a download.
+        Uses O_CREAT|O_EXCL so concurrent downloads of equally named files
+        can never end up writing to the same path.
+        """
+        stem, ext = os.path.splitext(filename)
+        key = (stem, ext)
+        i = self._next_suffix.get(key, 0)
+        
+        if i == 0:
+            # First time this name is used in this session: anything already
+            # there is left over from an earlier run. Telethon rewrites downloads
+            # from the start, so drop it instead of renaming around it.
+            leftover = os.path.join(self.temp_dir, filename)
+            try:
+                os.remove(leftover)
+                print(f"  ℹ Leftover file found in temp - removing to start fresh")
+            except OSError:
+                pass  # Missing, or not removable - a suffixed name is used below
+        
+        while True:
+            candidate = filename if i == 0 else f"{stem}_{i}{ext}"
+            path = os.path.join(self.temp_dir, candidate)
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                i += 1
+                continue
+            os.close(fd)
+            self._next_suffix[key] = i + 1
+            return path
+    
+    @staticmethod
+    def _make_progress_callback(state: _DownloadState):
+        """
+        Build the progress callback for one download.
+        Telethon calls it for every chunk, so it only records the numbers
+        (_render_progress turns them into output a couple of times a second)
+        and keeps the state and clock in closure locals.
+        """
+        monotonic = time.monotonic
+        
+        def progress_callback(downloaded_bytes: int, total_bytes: int):
+            state.last_progress_bytes = downloaded_bytes
+            state.last_progress_time = monotonic()
+            if total_bytes != state.total_bytes and total_bytes:
+                state.set_total(total_bytes)
+        
+        return progress_callback
+    
+    @staticmethod
+    def _format_progress(state: _DownloadState, now: float) -> bytes:
+        """Build the full progress bar line for one download."""
+        downloaded = state.last_progress_bytes
+        fraction = downloaded * state.inv_total
+        percent = fraction * 100
+        downloaded_mb = downloaded * _INV_MIB
+        total_mb = state.total_bytes * _INV_MIB
+        elapsed = now - state.start_time
+        speed = downloaded_mb / elapsed if elapsed > 0 else 0.0
+        # Show progress with a simple progress bar, sliced from pre-encoded bytes
+        filled = min(_BAR_LENGTH, int(_BAR_LENGTH * fraction)) * _BAR_GLYPH_BYTES
+        return b''.join((
+            _PROGRESS_PREFIX,
+            _BAR_FULL[:filled],
+            _BAR_EMPTY[filled:],
+            f"] {percent:.1f}% ({downloaded_mb:.1f} MB / {total_mb:.1f} MB) {speed:.1f} MB/s".encode('ascii'),
+        ))
+    
+    @staticmethod
+    def _format_summary(states: list, now: float) -> bytes:
+        """Build one compact line covering several concurrent downloads."""
+        parts = []
+        speed = 0.0
+        for state in states:
+            parts.append(f"{state.name[:20]} {state.last_progress_bytes * state.inv_total * 100:.0f}%")
+            elapsed = now - state.start_time
+            if elapsed > 0:
+                speed += state.last_progress_bytes * _INV_MIB / elapsed
+        return f"\r  📥 {' | '.join(parts)} - {speed:.1f} MB/s".encode('utf-8')
+    
+    async def _render_progress(self):
+        """
+        Redraw the progress line for all active downloads.
+        One writer for every download, so concurrent transfers share a single
+        line instead of overwriting each other's output chunk by chunk.
+        """
+        while self._active:
+            await asyncio.sleep(_PROGRESS_INTERVAL)
+            states = [state for state in self._active if state.total_bytes]
+            if not states:
+                continue
+            now = time.monotonic()
+            if len(states) == 1:
+                line = self._format_progress(states[0], now)
+            else:
+                line = self._format_summary(states, now)
+            self._redraw(line)
+        self._renderer = None
+    
+    def _redraw(self, line: bytes, newline: bool = False):
+        """Overwrite the current progress line, blanking out any longer previous one."""
+        padding = self._last_line_len - len(line)
+        if padding > 0:
+            line += b' ' * padding
+        if newline:
+            line += b'\n'
+        self._last_line_len = 0 if newline else len(line)
+        self._write_progress(line)
+    
+    @staticmethod
+    def _write_progress(line: bytes):
+        """Write an already-encoded progress line straight to stdout's byte stream."""
+        buffer = getattr(sys.stdout, 'buffer', None)
+        if buffer is None:
+            # Notebook streams have no byte layer
+            sys.stdout.write(line.decode('utf-8'))
+            sys.stdout.flush()
+            return
+        sys.stdout.flush()  # Keep ordering with pending print() output
+        buffer.write(line)
+        buffer.flush()
+    
+    async def _stall_watchdog(self, state: _DownloadState, total_size: int):
+        """
+        Warn when a download stops making progress.
+        Samples the bytes recorded by the progress callback on the event loop,
+        so no extra thread or stat() polling is needed.
+        """
         check_interval = 5  # Check every 5 seconds
-        wait_count = 0
+        stall_threshold = 15  # Warn after 15 seconds without progress
+        last_bytes = state.last_progress_bytes
+        stalled_for = 0
         start_time = time.time()
         
-        # Show heartbeat while waiting for file to appear
-        while not os.path.exists(file_path) and wait_count < 12 and not stop_event.is_set():  # Up to 60 seconds
+        while True:
+            await asyncio.sleep(check_interval)
             elapsed = int(time.time() - start_time)
-            if wait_count % 2 == 0:  # Every 10 seconds
-                sys.stdout.write(f"\r  ⏳ Waiting for download to start... ({elapsed}s elapsed)")
-                sys.stdout.flush()
-            time.sleep(5)
-            wait_count += 1
-        
-        if not os.path.exists(file_path) and not stop_event.is_set():
-            elapsed = int(time.time() - start_time)
-            print(f"\n  ⚠ File not created after {elapsed}s - download may be stuck at API level")
-            print(f"  💡 This might indicate a network/Telegram server issue")
-        
-        while not stop_event.is_set():
-            time.sleep(check_interval)
+            current_bytes = state.last_progress_bytes
             
-            if os.path.exists(file_path):
-                current_size = os.path.getsize(file_path)
-                current_time = time.time()
-                elapsed = int(current_time - start_time)
-                
-                # If file is growing, show progress
-                if current_size > last_size:
-                    percent = (current_size / total_size * 100) if total_size > 0 else 0
-                    time_diff = current_time - last_update if current_time > last_update else check_interval
-                    speed = (current_size - last_size) / time_diff if time_diff > 0 else 0
-                    speed_mb = speed / (1024 * 1024)
-                    
-                    bar_length = 30
-                    filled = int(bar_length * current_size // total_size) if total_size > 0 else 0
-                    bar = '█' * filled + '░' * (bar_length - filled)
-                    # Use sys.stdout.write for better control in Colab/Jupyter
-                    sys.stdout.write(f"\r  📥 [{bar}] {percent:.1f}% ({format_size(current_size)} / {format_size(total_size)}) @ {speed_mb:.1f} MB/s [{elapsed}s]")
-                    sys.stdout.flush()
-                    
-                    last_size = current_size
-                    last_update = current_time
-                    stalled_count = 0
+            if current_bytes > last_bytes:
+                last_bytes = current_bytes
+                stalled_for = 0
+                continue
+            
+            stalled_for += check_interval
+            if stalled_for >= stall_threshold:
+                if current_bytes == 0:
+                    print(f"\n  ⚠ Download has not started after {elapsed}s - may be stuck at API level")
                 else:
-                    # File not growing - might be stalled
-                    stalled_count += 1
-                    if stalled_count >= 3:  # 15 seconds of no growth (3 checks * 5s)
-                        elapsed = int(current_time - start_time)
-                        print(f"\n  ⚠ Download stalled (no progress for 15s). Current: {format_size(current_size)} / {format_size(total_size)} [{elapsed}s total]")
-                        stalled_count = 0  # Reset to avoid spam
-                
-                # If file is complete
-                if total_size > 0 and current_size >= total_size * 0.99:  # 99% complete
-                    stop_event.set()
-                    break
-            elif not stop_event.is_set():
-                # File doesn't exist yet or was deleted
-                elapsed = int(time.time() - start_time)
-                if elapsed > 60:  # After 60 seconds, warn
-                    print(f"\n  ⚠ Download seems stuck - no file created after {elapsed}s")
-                time.sleep(2)
+                    print(f"\n  ⚠ Download stalled (no progress for {stalled_for}s). Current: {format_size(current_bytes)} / {format_size(total_size)} [{elapsed}s total]")
+                stalled_for = 0  # Reset to avoid spam
     
-    def download_file(self, message, max_retries: int = 3) -> Optional[str]:
+    async def download_file(self, message, max_retries: int = 3,
+                            file_info: Optional[tuple] = None,
+                            dest_path: Optional[str] = None) -> Optional[str]:
         """
         Download a file from a Telegram message with FloodWait handling.
         
         Args:
             message: Telegram message object
             max_retries: Maximum number of retry attempts
+            file_info: (filename, file_size) if the caller already has it from get_file_info
+            dest_path: Already reserved path to write to instead of a new temp file
             
         Returns:
             Path to downloaded file or None if failed
         """
-        if not has_media(message):
-            return None
+        if file_info is None:
+            if not has_media(message):
+                return None
+            file_info = get_file_info(message)
         
-        filename, file_size = get_file_info(message)
+        filename, file_size = file_info
         if not filename:
             return None
         
-        # Reset resume offset for this download
-        self._resume_offset = 0
-        
-        temp_file_path = os.path.join(self.temp_dir, filename)
-        
-        # Check if file exists - if incomplete, we'll resume it
-        # If complete, we shouldn't be here (processor should skip), but handle it anyway
-        if os.path.exists(temp_file_path):
-            existing_size = os.path.getsize(temp_file_path)
-            if file_size and existing_size >= file_size * 0.99:  # 99% complete = done
-                # File is complete - this shouldn't happen (processor should skip), but handle it
-                # Delete the complete file and start fresh to avoid any issues
-                try:
-                    os.remove(temp_file_path)
-                    print(f"  ℹ Complete file found in temp - removing to start fresh")
-                except:
-                    # If delete fails, create new filename to avoid conflict
-                    counter = 1
-                    while os.path.exists(temp_file_path):
-                        name, ext = os.path.splitext(filename)
-                        temp_file_path = os.path.join(self.temp_dir, f"{name}_{counter}{ext}")
-                        counter += 1
-            elif file_size and existing_size > 0:
-                # Partial download exists - we'll resume it
-                percent = (existing_size / file_size * 100) if file_size > 0 else 0
-                print(f"  🔄 Resuming partial download: {format_size(existing_size)} / {format_size(file_size)} ({percent:.1f}%)")
-                # Track the offset for progress display
-                self._resume_offset = existing_size
-            else:
-                # New download
-                self._resume_offset = 0
+        state = _DownloadState(filename)
+        temp_file_path = dest_path or self._reserve_temp_path(filename)
         
-        # Create progress callback for large files (>50MB)
-        progress_callback = None
-        monitor_thread = None
-        stop_monitor = threading.Event()
+        if file_size:
+            state.set_total(file_size)  # Known up front, so the callback never has to
+        progress_callback = self._make_progress_callback(state)
+        watchdog = None
         
         if file_size and file_size > 50 * 1024 * 1024:  # > 50MB
             print(f"  ⏳ Starting download... (this may take a while for large files)")
-            print(f"  📊 Monitoring progress (updates every 5 seconds)...")
-            # Use monitor thread as primary (more reliable), callback as backup
-            # Set flag to coordinate output
-            self._monitor_active = True
-            progress_callback = self._progress_callback  # Keep for Telethon, but monitor will show progress
-            self._last_progress_bytes = 0
-            self._last_progress_time = time.time()
-            
-            # Start file size monitor as primary progress display
-            monitor_thread = threading.Thread(
-                target=self._monitor_file_size,
-                args=(temp_file_path, file_size, stop_monitor),
-                daemon=True
+            # Stall watchdog runs on the event loop alongside the download
+            watchdog = asyncio.create_task(self._stall_watchdog(state, file_size))
+        
+        self._active[state] = None
+        if self._renderer is None:
+            self._renderer = asyncio.create_task(self._render_progress())
+        
+        try:
+            result = await self._download_with_retry(
+                message, temp_file_path, file_size, progress_callback, max_retries
             )
-            monitor_thread.start()
+            if result is None and dest_path is None:
+                # Failed: don't leave a (possibly preallocated, full-size) temp file
+                # behind; a retry reserves a fresh path anyway
+                self._discard_temp(temp_file_path)
+            return result
+        except BaseException:
+            if dest_path is None:
+                self._discard_temp(temp_file_path)
+            raise
+        finally:
+            if watchdog:
+                watchdog.cancel()
+            del self._active[state]
+            if state.total_bytes:
+                # Settle this download's final line so later output starts fresh
+                self._redraw(self._format_progress(state, time.monotonic()), newline=True)
+    
+    @staticmethod
+    def _discard_temp(temp_file_path: str):
+        """Remove an unfinished temp download."""
+        try:
+            os.unlink(temp_file_path)
+        except FileNotFoundError:
+            pass
+    
+    async def _download_with_retry(self, message, temp_file_path: str, file_size: Optional[int],
+                                   progress_callback, max_retries: int) -> Optional[str]:
+        """Run the download with FloodWait/connection retry handling."""
+        # Pick the transfer strategy once; every attempt reuses it
+        if file_size and file_size >= _PARALLEL_MIN_SIZE and hasattr(os, 'pwrite'):
+            fetch = self._parallel_download
         else:
-            # For smaller files, use callback only
-            self._monitor_active = False
-            progress_callback = self._progress_callback
+            fetch = self._buffered_download
         
         # Download with retry logic - NO TIMEOUT
-        # Downloads will run until complete or until stall detection triggers
-        # The monitor thread will detect if download is truly stuck (no progress for 15+ seconds)
-        for attempt in range(max_retries):
+        # Downloads will run until complete; the stall watchdog reports stuck transfers
+        # FloodWaits don't use up attempts: Telegram says exactly when to come back
+        attempt = 0
+        while attempt < max_retries:
             try:
-                # Use the event loop to run the async download (no timeout - let it complete)
-                download_task = self.client.download_media(
-                    message, 
-                    file=temp_file_path,
-                    progress_callback=progress_callback
-                )
-                
                 # No timeout - let the download complete naturally
-                # Stall detection in monitor thread will catch truly stuck downloads
-                result = self.client.loop.run_until_complete(download_task)
-                
-                # Stop monitor thread
-                if monitor_thread:
-                    stop_monitor.set()
-                    monitor_thread.join(timeout=2)
+                async with self._permits:
+                    result = await fetch(message, temp_file_path, file_size, progress_callback)
                 
                 if result and os.path.exists(result):
-                    if progress_callback or monitor_thread:
-                        print()  # New line after progress
                     return result
                 elif os.path.exists(temp_file_path):
-                    if progress_callback or monitor_thread:
-                        print()  # New line after progress
                     return temp_file_path
                 return None
                 
             except KeyboardInterrupt:
                 # User manually stopped - clean up and return
-                if monitor_thread:
-                    stop_monitor.set()
-                    monitor_thread.join(timeout=2)
                 print(f"\n  ⚠ Download interrupted by user")
-                if os.path.exists(temp_file_path):
-                    current_size = os.path.getsize(temp_file_path)
-                    if current_size > 0:
-                        print(f"  📊 Partial download saved: {format_size(current_size)} / {format_size(file_size)}")
+                try:
+                    current_size = os.stat(temp_file_path).st_size
+                except FileNotFoundError:
+                    current_size = 0
+                if current_size > 0:
+                    print(f"  📊 Partial download discarded: {format_size(current_size)} / {format_size(file_size)}")
                 return None
             except FloodWaitError as e:
-                wait_time = e.seconds
+                # Telegram dictates the wait; cap it so one file can't park a worker for hours
+                wait_time = min(e.seconds, _FLOOD_WAIT_CAP)
                 print(f"  ⚠ FloodWait: Waiting {wait_time} seconds before retry...")
-                time.sleep(wait_time)
+                self._shrink_permits()
+                await self._sleep_with_jitter(wait_time)
                 continue
-            except (TimeoutError, ConnectionError) as e:
-                # Handle timeout and connection errors with longer wait
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 10  # Progressive backoff: 10s, 20s, 30s
-                    print(f"  ⚠ Timeout/Connection error (attempt {attempt + 1}/{max_retries}): {str(e)}")
+            except (asyncio.TimeoutError, OSError) as e:
+                # Timeouts and connection errors (both OSError subclasses) follow the backoff table
+                attempt += 1
+                if attempt < max_retries:
+                    wait_time = _BACKOFF_SCHEDULE[min(attempt - 1, len(_BACKOFF_SCHEDULE) - 1)]
+                    print(f"  ⚠ Timeout/Connection error (attempt {attempt}/{max_retries}): {str(e)}")
                     print(f"  ⏳ Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
+                    await self._sleep_with_jitter(wait_time)
                     continue
                 else:
                     print(f"  ✗ Download failed after {max_retries} attempts: {str(e)}")
                     return None
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"  ⚠ Download error (attempt {attempt + 1}/{max_retries}): {str(e)}")
-                    time.sleep(5)
+                attempt += 1
+                if attempt < max_retries:
+                    print(f"  ⚠ Download error (attempt {attempt}/{max_retries}): {str(e)}")
+                    await self._sleep_with_jitter(_ERROR_RETRY_DELAY)
                 else:
                     print(f"  ✗ Download failed after {max_retries} attempts: {str(e)}")
                     return None
         
         return None
     
-    def get_channel_messages(self, entity, reverse: bool = False):
+    @staticmethod
+    async def _sleep_with_jitter(seconds: float):
+        """Sleep for seconds plus up to _RETRY_JITTER of it, at random."""
+        await asyncio.sleep(seconds + random.uniform(0, seconds * _RETRY_JITTER))
+    
+    def _shrink_permits(self):
+        """
+        Take one transfer slot out of service after a FloodWait (never the last
+        one) and schedule it to come back after _PERMIT_RECOVERY_DELAY seconds.
+        """
+        if self._permit_limit <= 1:
+            return
+        self._permit_limit -= 1
+        task = asyncio.create_task(self._hold_permit())
+        self._governor_tasks.add(task)
+        task.add_done_callback(self._governor_tasks.discard)
+    
+    async def _hold_permit(self):
+        """Hold one transfer slot for the recovery delay, then release it."""
+        async with self._permits:
+            await asyncio.sleep(_PERMIT_RECOVERY_DELAY)
+        self._permit_limit += 1
+    
+    async def _buffered_download(self, message, temp_file_path: str, file_size: Optional[int],
+                                 progress_callback) -> str:
+        """
+        Download over a single GetFile stream into a buffered file.
+        
+        Args:
+            message: Telegram message with media
+            temp_file_path: Reserved path to write to
+            file_size: Document size in bytes, or None for photos
+            progress_callback: Called with (downloaded_bytes, total_bytes)
+            
+        Returns:
+            temp_file_path once the download has finished
+        """
+        if file_size:
+            location, expected_size, dc_id = message.media.document, file_size, None
+        else:
+            location, expected_size = self._largest_photo_location(message.media)
+            dc_id = message.media.photo.dc_id if location else None
+        
+        # Hand Telethon our own buffered file so parts are coalesced into few
+        # write() calls; the buffer grows with the file instead of always
+        # allocating the full 2 MiB for a 30 KB photo
+        buffer_size = min(_WRITE_BUFFER_SIZE, max(expected_size or 0, _MIN_WRITE_BUFFER_SIZE))
+        with open(temp_file_path, 'wb', buffering=buffer_size) as raw:
+            # Hash the parts as they arrive, so the move into Drive needn't read
+            # the file just to hash it
+            f = _HashingWriter(raw)
+            if location:
+                # Fetch full 512 KiB parts: Telethon would pick 128 KiB for anything
+                # under 100 MB (4x the requests), so most photos now take one request
+                await self.client.download_file(
+                    location,
+                    f,
+                    part_size_kb=_PART_SIZE // 1024,
+                    file_size=expected_size,
+                    dc_id=dc_id,
+                    progress_callback=progress_callback
+                )
+            else:
+                await self.client.download_media(
+                    message,
+                    file=f,
+                    progress_callback=progress_callback
+                )
+        self._file_hashes[temp_file_path] = f.hexdigest()
+        return temp_file_path
+    
+    @staticmethod
+    def _largest_photo_location(media):
+        """
+        Find the largest downloadable size of a photo.
+        
+        Args:
+            media: Message media
+            
+        Returns:
+            tuple: (InputPhotoFileLocation, size_in_bytes) or (None, None)
+        """
+        if not isinstance(media, MessageMediaPhoto) or not media.photo:
+            return None, None
+        
+        best, best_bytes = None, 0
+        for size in media.photo.sizes:
+            if isinstance(size, PhotoSize):
+                size_bytes = size.size
+            elif isinstance(size, PhotoSizeProgressive):
+                size_bytes = max(size.sizes)
+            else:
+                continue  # Stripped/cached/path sizes are inline thumbnails
+            if size_bytes > best_bytes:
+                best, best_bytes = size, size_bytes
+        
+        if best is None:
+            return None, None
+        photo = media.photo
+        location = InputPhotoFileLocation(
+            id=photo.id,
+            access_hash=photo.access_hash,
+            file_reference=photo.file_reference,
+            thumb_size=best.type
+        )
+        return location, best_bytes
+    
+    async def _parallel_download(self, message, temp_file_path: str, file_size: int,
+                                 progress_callback) -> str:
+        """
+        Download a document as several concurrent GetFile request streams,
+        sharing the client's sender for the document's DC.
+        
+        Args:
+            message: Telegram message with a document
+            temp_file_path: Reserved path to write to
+            file_size: Document size in bytes
+            progress_callback: Called with (downloaded_bytes, total_bytes)
+            
+        Returns:
+            temp_file_path once every part has been written
+        """
+        document = message.media.document
+        total_parts = -(-file_size // _PART_SIZE)
+        streams = min(self.streams, total_parts)
+        parts_per_stream = -(-total_parts // streams)
+        downloaded = 0
+        
+        fd = os.open(temp_file_path, os.O_WRONLY)
+        
+        async def fetch(first_part: int, part_count: int):
+            nonlocal downloaded
+            position = first_part * _PART_SIZE
+            async for chunk in self.client.iter_download(
+                document,
+                offset=position,
+                limit=part_count,
+                request_size=_PART_SIZE,
+                file_size=file_size
+            ):
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+                downloaded += len(chunk)
+                progress_callback(downloaded, file_size)
+        
+        try:
+            # Preallocate so every stream writes in place (real blocks where the
+            # filesystem supports it, else just the size)
+            try:
+                os.posix_fallocate(fd, 0, file_size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, file_size)
+            tasks = [
+                asyncio.create_task(fetch(first, min(parts_per_stream, total_parts - first)))
+                for first in range(0, total_parts, parts_per_stream)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # One stream failed (or we were cancelled): stop the rest before retrying
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        finally:
+            os.close(fd)
+        
+        return temp_file_path
+    
+    async def get_channel_messages(self, entity, reverse: bool = False, min_id: int = 0):
         """
         Get all messages with media from a Telegram channel.
         
         Args:
-            entity: Telegram channel entity
+            entity: Telegram channel entity (ideally a resolved InputPeer)
             reverse: If True, get oldest first; if False, get newest first
+            min_id: Only messages newer than this id (0 for the whole history)
             
         Yields:
-            Messages with media
+            tuple: (message, filename, file_size) for each message with
+            downloadable media; file info is read here once per message
         """
-        for message in self.client.iter_messages(entity, reverse=reverse):
-            if has_media(message):
-                yield message
+        # Telethon's own pacing (1s between history pages on long scans) stays:
+        # GetHistory floods at about 10 requests per 30s. Re-runs page less via min_id.
+        async for message in self.client.iter_messages(entity, reverse=reverse, min_id=min_id):
+            filename, file_size = get_file_info(message)  # (None, None) without media
+            if filename:
+                yield message, filename, file_size
 
@@ -3,10 +3,80 @@ Logging utility for the mirror script
 """
 
 import os
+import time
+import queue
+import atexit
+import threading
 import logging
+import logging.handlers
 from datetime import datetime
 from typing import Optional
 
+_LOG_BUFFER_SIZE = 64 * 1024
+_LOG_FLUSH_INTERVAL = 2.0
+
+
+class _BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotating file handler with a 64 KiB write buffer that is flushed every
+    couple of seconds (by a background thread, so the tail of the log is
+    written out even when no further records arrive) instead of after every
+    record. Warnings and errors are flushed right away.
+    """
+    
+    def __init__(self, *args, flush_interval: float = _LOG_FLUSH_INTERVAL, **kwargs):
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._bytes_written = 0
+        self._record_size = 0
+        self._rotatable = False
+        super().__init__(*args, **kwargs)
+        self._stop_flushing = threading.Event()
+        threading.Thread(target=self._flush_periodically, name='tg_mirror-log-flush',
+                         daemon=True).start()
+    
+    def _flush_periodically(self):
+        """Write out buffered records every flush_interval until closed."""
+        while not self._stop_flushing.wait(self.flush_interval):
+            self._flush_now()
+    
+    def _flush_now(self):
+        """Flush the buffer regardless of when it was last flushed."""
+        self._last_flush = time.monotonic()
+        super().flush()
+    
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=_LOG_BUFFER_SIZE,
+                      encoding=self.encoding, errors=self.errors)
+        self._bytes_written = stream.seek(0, 2)
+        # Never roll over anything other than a regular file (e.g. /dev/null)
+        self._rotatable = os.path.isfile(self.baseFilename)
+        return stream
+    
+    def shouldRollover(self, record):
+        # The base class seeks the stream per record to learn its size, which
+        # also flushes the buffer; track the (approximate) size ourselves instead
+        if self.stream is None:
+            self.stream = self._open()
+        self._record_size = len(self.format(record)) + 1
+        return (self.maxBytes > 0 and self._rotatable
+                and self._bytes_written + self._record_size >= self.maxBytes)
+    
+    def emit(self, record):
+        super().emit(record)
+        self._bytes_written += self._record_size
+        if record.levelno >= logging.WARNING:
+            self._flush_now()  # Don't leave an error sitting in the buffer
+    
+    def flush(self):
+        # Closing or rolling over closes the stream, which flushes it regardless
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_now()
+    
+    def close(self):
+        self._stop_flushing.set()
+        super().close()
+
 
 class MirrorLogger:
     """Logger for mirror operations with optional file logging."""
@@ -21,6 +91,8 @@ class MirrorLogger:
         """
         self.logger = logging.getLogger('tg_mirror')
         self.logger.setLevel(logging.INFO)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._file_handler: Optional[logging.Handler] = None
         
         # Clear existing handlers
         self.logger.handlers.clear()
@@ -45,14 +117,31 @@ class MirrorLogger:
             if log_dir:
                 os.makedirs(log_dir, exist_ok=True)
             
-            file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
+            # Rotate at 10 MB, keeping 5 old logs
+            file_handler = _BufferedRotatingFileHandler(
+                log_file,
+                mode='a',
+                maxBytes=10 * 1024 * 1024,
+                backupCount=5,
+                encoding='utf-8',
+                delay=True
+            )
             file_handler.setLevel(logging.DEBUG)
             file_formatter = logging.Formatter(
                 '%(asctime)s - %(levelname)s - %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             file_handler.setFormatter(file_formatter)
-            self.logger.addHandler(file_handler)
+            
+            # File I/O happens on a background listener thread; callers only enqueue
+            log_queue = queue.Queue(-1)
+            self._file_handler = file_handler
+            self._listener = logging.handlers.QueueListener(
+                log_queue, file_handler, respect_handler_level=True
+            )
+            self._listener.start()
+            atexit.register(self.close)
+            self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
             
             self.log_file = log_file
             self.logger.info(f"Logging to file: {log_file}")
@@ -74,4 +163,13 @@ class MirrorLogger:
     def debug(self, message: str):
         """Log debug message."""
         self.logger.debug(message)
+    
+    def close(self):
+        """Flush queued records to the log file and stop the listener thread."""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+        if self._file_handler:
+            self._file_handler.close()  # Writes out whatever is still buffered
+            self._file_handler = None
 
@@ -4,24 +4,66 @@ Main processing orchestration for mirroring
 
 import os
 import time
+import traceback
+import random
+import asyncio
 from typing import Optional, Callable
 from telethon import TelegramClient
+from telethon.utils import get_peer_id
 from telethon.errors import FloodWaitError, SessionPasswordNeededError
 
-from .config import Config
+from .config import Config, TELEGRAM_CLIENT_OPTIONS
 from .downloader import TelegramDownloader
 from .uploader import DriveUploader
-from .utils import format_size, get_file_info, get_existing_files, setup_directories
+from .utils import (
+    format_size, setup_directories,
+    get_media_id, load_manifest, append_manifest_entries, get_existing_files,
+    drive_api_client, update_drive_folder_metadata,
+    load_last_message_id, save_last_message_id
+)
+
+# Per-message retry policy: attempt N waits base * 2**(N-1) seconds (capped),
+# plus up to _RETRY_JITTER of that at random so workers don't retry in lockstep
+_RETRY_BASE_DELAY = 5
+_CONNECTION_RETRY_DELAY = 30
+_RETRY_MAX_DELAY = 300
+_RETRY_JITTER = 0.2
+
+# Transient progress events (downloading/uploading) are forwarded at most this
+# often; the rest (started, skipped, completed, failed, ...) always go through
+_NOTIFY_INTERVAL = 1.0
+_THROTTLED_EVENTS = frozenset(("downloading", "uploading"))
+# Manifest records are written in batches of this many (and at the end of a
+# run): each append to the file on the Drive mount costs a sync of the file.
+# Records lost to a crash only cost a name+size skip check on the next run.
+_MANIFEST_BATCH_SIZE = 25
 
 
 class MirrorProcessor:
     """Main processor for mirroring Telegram channels to Google Drive."""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, client: Optional[TelegramClient] = None,
+                 entity_cache: Optional[dict] = None):
+        """
+        Args:
+            config: Mirror configuration
+            client: Already constructed TelegramClient to reuse (e.g. kept alive by
+                the bot across runs). It is connected if needed but never
+                disconnected by cleanup(); its owner does that.
+            entity_cache: Optional {channel_link: (input_peer, title)} dict shared
+                across runs so repeated mirrors of a channel skip resolving it
+        """
         self.config = config
         self.downloader: Optional[TelegramDownloader] = None
         self.uploader: Optional[DriveUploader] = None
-        self.client: Optional[TelegramClient] = None
+        self.client: Optional[TelegramClient] = client
+        self._owns_client = client is None
+        self.entity_cache = entity_cache if entity_cache is not None else {}
+        
+        # Resolved channel and Drive target folder (set by initialize)
+        self.drive_folder_path: Optional[str] = None
+        self.input_peer = None
+        self.channel_title: Optional[str] = None
         
         # Statistics
         self.downloaded_count = 0
@@ -29,19 +71,34 @@ class MirrorProcessor:
         self.failed_count = 0
         self.total_size = 0
         
+        # Per-run state shared by the download workers
+        self._existing_files: dict = {}
+        self._manifest: dict = {}  # media id -> (filename, size, md5) already in Drive
+        self._manifest_pending: list = []  # (media id, filename, size, md5) not yet written
+        self._by_md5: dict = {}  # md5 -> (filename, size) of hashed files in the manifest
+        self._move_queue: Optional[asyncio.Queue] = None  # Downloaded files waiting to go to Drive
+        self._max_retries_per_message = 3
+        
         # Progress callback (optional, for bot integration)
         self.progress_callback: Optional[Callable] = None
+        self._last_notify = 0.0
     
     def set_progress_callback(self, callback: Callable):
         """Set a callback function for progress updates."""
         self.progress_callback = callback
     
     def _notify_progress(self, message: str, **kwargs):
-        """Notify progress via callback if set."""
-        if self.progress_callback:
-            self.progress_callback(message, **kwargs)
+        """Notify progress via callback if set (transient events throttled)."""
+        if not self.progress_callback:
+            return
+        if message in _THROTTLED_EVENTS:
+            now = time.monotonic()
+            if now - self._last_notify < _NOTIFY_INTERVAL:
+                return
+            self._last_notify = now
+        self.progress_callback(message, **kwargs)
     
-    def initialize(self) -> bool:
+    async def initialize(self) -> bool:
         """Initialize clients and connections."""
         try:
             # Mount Drive if in Colab
@@ -50,29 +107,43 @@ class MirrorProcessor:
                     print("✗ Cannot proceed without Drive access")
                     return False
             
-            # Setup directories
-            drive_folder_path = self.config.get_drive_folder_path()
-            setup_directories(self.config.temp_download_dir, drive_folder_path)
-            print(f"\n✓ Directories set up:")
-            print(f"  - Temp: {self.config.temp_download_dir}")
-            print(f"  - Drive: {drive_folder_path}")
+            self.drive_folder_path = self.config.get_drive_folder_path()
             
-            # Initialize Telegram client
             print("\n" + "=" * 60)
             print("Connecting to Telegram...")
             print("=" * 60)
             
-            session_file = self.config.get_session_file()
-            self.client = TelegramClient(
-                session_file,
-                self.config.api_id,
-                self.config.api_hash
-            )
-            self.client.start()
+            if self.client is None:
+                session_file = self.config.session_file
+                self.client = TelegramClient(
+                    session_file,
+                    self.config.api_id,
+                    self.config.api_hash,
+                    **TELEGRAM_CLIENT_OPTIONS
+                )
+            if not self.client.is_connected():
+                await self.client.connect()
+            
+            if await self.client.is_user_authorized():
+                # Drive setup (directories, folder listing) and resolving the channel
+                # touch independent resources: run them side by side, the Drive part
+                # in a thread since the mount blocks
+                self.uploader, _ = await asyncio.gather(
+                    asyncio.to_thread(self._init_drive),
+                    self._init_telegram()
+                )
+            else:
+                # First login prompts for phone and code: finish it before the
+                # Drive setup prints anything, so the prompt isn't buried
+                await self._init_telegram()
+                self.uploader = await asyncio.to_thread(self._init_drive)
             
-            # Initialize downloader and uploader
-            self.downloader = TelegramDownloader(self.client, self.config.temp_download_dir)
-            self.uploader = DriveUploader(drive_folder_path)
+            self.downloader = TelegramDownloader(
+                self.client,
+                self.config.temp_download_dir,
+                max_concurrency=self.config.max_concurrent_downloads,
+                streams=self.config.download_streams
+            )
             
             return True
             
@@ -81,191 +152,174 @@ class MirrorProcessor:
             return False
         except Exception as e:
             print(f"\n✗ Fatal error during initialization: {str(e)}")
-            import traceback
             traceback.print_exc()
             return False
     
-    def process_channel(self) -> bool:
+    def _init_drive(self) -> DriveUploader:
+        """Set up the temp and Drive folders and snapshot the Drive folder (blocking)."""
+        drive_folder_path = self.drive_folder_path
+        setup_directories(self.config.temp_download_dir, drive_folder_path)
+        print(f"\n✓ Directories set up:")
+        print(f"  - Temp: {self.config.temp_download_dir}")
+        print(f"  - Drive: {drive_folder_path}")
+        if self.config.drive_folder_metadata:
+            self._apply_folder_metadata()
+        
+        drive_api_folder = self.config.get_drive_api_folder() if self.config.drive_api_listing else None
+        return DriveUploader(
+            drive_folder_path,
+            existing_files=get_existing_files(drive_folder_path, drive_api_folder),
+            temp_dir=self.config.temp_download_dir
+        )
+    
+    async def _init_telegram(self):
+        """Log in (interactively on first use) and resolve the configured channel."""
+        if not await self.client.is_user_authorized():
+            await self.client.start()
+        
+        # Resolve the channel once; downstream calls get an InputPeer so
+        # Telethon never has to resolve the username again this session
+        print(f"\n✓ Connected! Accessing channel: {self.config.channel_link}")
+        # Usernames are case-insensitive, so '@Foo' and '@foo' share an entry
+        cache_key = self.config.channel_link.lower()
+        cached = self.entity_cache.get(cache_key)
+        if cached:
+            self.input_peer, self.channel_title = cached
+        else:
+            # get_input_entity answers from the on-disk session database when
+            # this channel was seen on an earlier run, skipping the heavily
+            # rate-limited ResolveUsername; fetching by InputPeer is a cheap call
+            self.input_peer = await self.client.get_input_entity(self.config.channel_link)
+            entity = await self.client.get_entity(self.input_peer)
+            self.channel_title = getattr(entity, 'title', None) or self.config.channel_link
+            self.entity_cache[cache_key] = (self.input_peer, self.channel_title)
+        print(f"✓ Channel found: {self.channel_title}")
+    
+    def _apply_folder_metadata(self):
+        """Set DRIVE_FOLDER_METADATA on the Drive target folder in one API call."""
+        service = drive_api_client(readonly=False)
+        if service is None:
+            print("⚠️ DRIVE_FOLDER_METADATA set but the Drive API is unavailable - skipping")
+            return
+        if update_drive_folder_metadata(service, self.config.get_drive_api_folder(),
+                                        self.config.drive_folder_metadata):
+            print("✓ Drive folder metadata updated")
+    
+    async def process_channel(self) -> bool:
         """Process all files from the configured channel."""
-        if not self.client or not self.downloader or not self.uploader:
+        if not self.client or not self.downloader or not self.uploader or not self.input_peer:
             print("✗ Error: Not initialized. Call initialize() first.")
             return False
         
         try:
-            # Verify channel access
-            print(f"\n✓ Connected! Accessing channel: {self.config.channel_link}")
-            # get_entity is async, so we need to await it properly
-            entity = self.client.loop.run_until_complete(
-                self.client.get_entity(self.config.channel_link)
-            )
-            channel_title = entity.title if hasattr(entity, 'title') else self.config.channel_link
-            print(f"✓ Channel found: {channel_title}")
-            
-            # Get messages as generator (memory efficient)
-            print("\n" + "=" * 60)
-            print("Fetching messages from channel...")
-            print("=" * 60)
+            # Incremental run: a clean earlier run recorded the newest message it
+            # mirrored, so only newer history is paged (FULL_RESCAN=true walks it all)
+            channel_key = str(get_peer_id(self.input_peer))
+            min_id = 0
+            if not self.config.full_rescan:
+                min_id = await asyncio.to_thread(load_last_message_id, self.drive_folder_path, channel_key)
+                if min_id:
+                    print(f"\n✓ Resuming after message {min_id} (set FULL_RESCAN=true to rescan the whole channel)")
             
+            # Stream messages straight into the workers: the first download starts
+            # with the first history page instead of after a full counting pass
             messages_generator = self.downloader.get_channel_messages(
-                entity,
-                reverse=self.config.reverse_order
+                self.input_peer,
+                reverse=self.config.reverse_order,
+                min_id=min_id
             )
             
-            # Count total files first (for progress tracking)
-            # We'll iterate twice, but it's better than loading all into memory
-            print("  Counting files...")
-            total_files = sum(1 for _ in self.downloader.get_channel_messages(
-                entity,
-                reverse=self.config.reverse_order
-            ))
-            
-            if total_files == 0:
-                print("No media files found in the channel. Exiting.")
-                return True
-            
-            print(f"\n✓ Found {total_files} messages with media files")
-            
             # Get existing files for resume capability (now with sizes)
-            drive_folder_path = self.config.get_drive_folder_path()
-            existing_files = get_existing_files(drive_folder_path)
-            print(f"\n✓ Found {len(existing_files)} existing files in Drive folder (will skip if already downloaded)")
+            # Shared with the uploader, which keeps it current as files are moved in
+            self._existing_files = self.uploader.existing_files
+            print(f"\n✓ Found {len(self._existing_files)} existing files in Drive folder (will skip if already downloaded)")
+            self._manifest = load_manifest(self.drive_folder_path)
+            self._by_md5 = {
+                md5: (name, size) for name, size, md5 in self._manifest.values() if md5
+            }
             
             # Process files
             print("\n" + "=" * 60)
             print("Starting download and upload process...")
             print("=" * 60)
             
-            self._notify_progress("started", total=total_files)
+            self._notify_progress("started", total=None)
+            
+            # Pipeline: one task pages through the channel, a bounded pool of
+            # workers downloads, and a pool of movers copies finished files into
+            # Drive, so the next download streams in while the last one is moved.
+            # The bounded queues back-pressure the stages before them.
+            concurrency = max(1, self.config.max_concurrent_downloads)
+            upload_concurrency = max(1, self.config.max_concurrent_uploads)
+            queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+            self._move_queue = asyncio.Queue(maxsize=upload_concurrency)
+            
+            total_files = 0
+            newest_id = min_id
+            
+            async def produce():
+                nonlocal total_files, newest_id
+                async for message, filename, file_size in messages_generator:
+                    total_files += 1
+                    newest_id = max(newest_id, message.id)
+                    await queue.put((total_files, message, (filename, file_size)))
+                for _ in range(concurrency):
+                    await queue.put(None)
             
-            # Track retry attempts per message to prevent infinite loops
-            message_retries = {}
-            max_retries_per_message = 3
+            async def consume():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    idx, message, file_info = item
+                    await self._process_message(idx, message, file_info, None)
             
-            for idx, message in enumerate(messages_generator, 1):
+            async def move():
+                while True:
+                    item = await self._move_queue.get()
+                    if item is None:
+                        return
+                    await self._move_to_drive(*item)
+            
+            async def finish_downloads():
+                await asyncio.gather(*workers)
+                for _ in movers:
+                    await self._move_queue.put(None)
+            
+            movers = [asyncio.create_task(move()) for _ in range(upload_concurrency)]
+            workers = [asyncio.create_task(produce())]
+            workers += [asyncio.create_task(consume()) for _ in range(concurrency)]
+            feeder = asyncio.create_task(finish_downloads())
+            try:
+                # Watch the movers alongside the downloads: a dead mover would leave
+                # the workers blocked on the full move queue, so it ends the run
+                done, _ = await asyncio.wait([feeder, *movers], return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if not task.cancelled() and task.exception():
+                        raise task.exception()
+            finally:
+                # Stop whatever is still running (gather() leaves the other stages
+                # running when one fails) and let it unwind before the final flush
+                stages = workers + movers + [feeder]
+                for task in stages:
+                    task.cancel()
+                await asyncio.gather(*stages, return_exceptions=True)
+                await self._flush_manifest()
+                await asyncio.to_thread(self.uploader.sync)
+            
+            # Only a run with nothing failed may move the mark: every message up
+            # to it is then in Drive (or deliberately skipped)
+            if newest_id > min_id and self.failed_count == 0:
                 try:
-                    filename, file_size = get_file_info(message)
-                    
-                    if not filename:
-                        print(f"\n[{idx}/{total_files}] ⚠ Skipping message {message.id}: Could not extract file info")
-                        continue
-                    
-                    # Check if file already exists (resume capability)
-                    # Now checks both filename AND size to ensure file is complete
-                    if filename in existing_files:
-                        existing_size = existing_files[filename]
-                        # If file size matches (within 1% tolerance) or file_size is None, skip it
-                        if file_size is None or abs(existing_size - file_size) / file_size < 0.01:
-                            print(f"\n[{idx}/{total_files}] ⊘ SKIPPED (already exists): {filename}")
-                            self.skipped_count += 1
-                            if file_size:
-                                self.total_size += file_size
-                            self._notify_progress("skipped", current=idx, total=total_files, filename=filename)
-                            continue
-                        else:
-                            # File exists but size doesn't match - might be incomplete, re-download
-                            print(f"\n[{idx}/{total_files}] ⚠ File exists but size mismatch - re-downloading: {filename}")
-                            print(f"    Existing: {format_size(existing_size)}, Expected: {format_size(file_size)}")
-                    
-                    # Check retry count for this message
-                    message_id = message.id
-                    if message_id not in message_retries:
-                        message_retries[message_id] = 0
-                    
-                    if message_retries[message_id] >= max_retries_per_message:
-                        print(f"\n[{idx}/{total_files}] ✗ SKIPPED (max retries exceeded): {filename}")
-                        self.failed_count += 1
-                        self._notify_progress("failed", current=idx, total=total_files, filename=filename, reason="max_retries")
-                        continue
-                    
-                    print(f"\n[{idx}/{total_files}] ↓ Downloading: {filename}")
-                    if file_size:
-                        print(f"    Size: {format_size(file_size)}")
-                    
-                    self._notify_progress("downloading", current=idx, total=total_files, filename=filename, size=file_size)
-                    
-                    # Download file
-                    downloaded_path = self.downloader.download_file(message)
-                    
-                    if not downloaded_path or not os.path.exists(downloaded_path):
-                        message_retries[message_id] = message_retries.get(message_id, 0) + 1
-                        if message_retries[message_id] < max_retries_per_message:
-                            print(f"  ✗ Download failed (retry {message_retries[message_id]}/{max_retries_per_message})")
-                            # Retry this message by continuing (will be processed again if generator allows)
-                            # Since we can't go back in generator, we'll just skip and let it fail after max retries
-                            continue
-                        else:
-                            print(f"  ✗ Download failed after {max_retries_per_message} attempts")
-                            self.failed_count += 1
-                            self._notify_progress("failed", current=idx, total=total_files, filename=filename, reason="download")
-                            continue
-                    
-                    # Upload to Drive
-                    print(f"  ↑ Uploading to Drive...")
-                    self._notify_progress("uploading", current=idx, total=total_files, filename=filename)
-                    
-                    success, final_path = self.uploader.upload_file(downloaded_path, filename)
-                    
-                    if success:
-                        self.downloaded_count += 1
-                        actual_size = os.path.getsize(final_path)
-                        self.total_size += actual_size
-                        print(f"  ✓ Success! ({format_size(actual_size)})")
-                        self._notify_progress("completed", current=idx, total=total_files, filename=filename, size=actual_size)
-                    else:
-                        message_retries[message_id] = message_retries.get(message_id, 0) + 1
-                        if message_retries[message_id] < max_retries_per_message:
-                            print(f"  ✗ Upload failed (retry {message_retries[message_id]}/{max_retries_per_message})")
-                            # Retry by continuing (but we can't go back in generator, so this will just move to next)
-                            # In practice, upload failures are usually fatal, so we'll just fail
-                            self.failed_count += 1
-                            self._notify_progress("failed", current=idx, total=total_files, filename=filename, reason="upload")
-                        else:
-                            print(f"  ✗ Upload failed after {max_retries_per_message} attempts")
-                            self.failed_count += 1
-                            self._notify_progress("failed", current=idx, total=total_files, filename=filename, reason="upload")
-                
-                except FloodWaitError as e:
-                    wait_time = e.seconds
-                    message_retries[message_id] = message_retries.get(message_id, 0) + 1
-                    if message_retries[message_id] < max_retries_per_message:
-                        print(f"\n  ⚠ FloodWait: Waiting {wait_time} seconds... (retry {message_retries[message_id]}/{max_retries_per_message})")
-                        time.sleep(wait_time)
-                        # Can't retry with generator, so we'll just continue to next message
-                        # FloodWait is usually temporary, so next run will retry
-                        continue
-                    else:
-                        print(f"\n  ✗ FloodWait exceeded max retries for message {message.id}")
-                        self.failed_count += 1
-                        continue
-                except (TimeoutError, ConnectionError) as e:
-                    message_retries[message_id] = message_retries.get(message_id, 0) + 1
-                    if message_retries[message_id] < max_retries_per_message:
-                        print(f"\n  ⚠ Timeout/Connection error on message {message.id}: {str(e)} (retry {message_retries[message_id]}/{max_retries_per_message})")
-                        print(f"  ⏳ Waiting 30 seconds before retry...")
-                        time.sleep(30)
-                        continue
-                    else:
-                        print(f"\n  ✗ Timeout/Connection error exceeded max retries for message {message.id}")
-                        self.failed_count += 1
-                        continue
-                except Exception as e:
-                    message_retries[message_id] = message_retries.get(message_id, 0) + 1
-                    if message_retries[message_id] < max_retries_per_message:
-                        print(f"\n  ✗ Error processing message {message.id}: {str(e)} (retry {message_retries[message_id]}/{max_retries_per_message})")
-                        time.sleep(5)  # Brief delay before retry
-                        continue
-                    else:
-                        print(f"\n  ✗ Error processing message {message.id}: {str(e)} (max retries exceeded)")
-                        self.failed_count += 1
-                        self._notify_progress("error", current=idx, total=total_files, error=str(e))
-                        continue
-                
-                # Success - reset retry count and add rate limiting delay
-                if message_id in message_retries:
-                    del message_retries[message_id]
-                
-                # Rate limiting: small delay between files to avoid triggering Telegram limits
-                time.sleep(1)  # 1 second delay between files
+                    await asyncio.to_thread(
+                        save_last_message_id, self.drive_folder_path, channel_key, newest_id
+                    )
+                except OSError as e:
+                    print(f"  ⚠ Could not save resume point: {str(e)}")
+            
+            if total_files == 0:
+                print("No new media since the last run." if min_id else "No media files found in the channel.")
+                return True
             
             # Summary
             self._print_summary(total_files)
@@ -280,11 +334,222 @@ class MirrorProcessor:
             
         except Exception as e:
             print(f"\n✗ Fatal error: {str(e)}")
-            import traceback
             traceback.print_exc()
             self._notify_progress("error", error=str(e))
             return False
     
+    async def _process_message(self, idx: int, message, file_info: tuple,
+                               total_files: Optional[int]):
+        """
+        Download a single message's media and move it to Drive.
+        The message object is already in hand, so transient failures are retried
+        in place (exponential backoff with jitter) instead of being dropped.
+        """
+        total_label = total_files or '?'  # Unknown while the channel is still being paged
+        max_retries = self._max_retries_per_message
+        
+        for attempt in range(1, max_retries + 1):
+            try:
+                if await self._attempt_message(idx, message, file_info, total_files, total_label):
+                    return
+                reason = "download"
+                print(f"  ✗ Download failed (attempt {attempt}/{max_retries})")
+                delay = self._retry_delay(_RETRY_BASE_DELAY, attempt)
+            except FloodWaitError as e:
+                reason = "flood_wait"
+                print(f"\n  ⚠ FloodWait on message {message.id}: {e.seconds}s (attempt {attempt}/{max_retries})")
+                # Telegram names the wait; the jitter only staggers the workers
+                delay = e.seconds + random.uniform(0, e.seconds * _RETRY_JITTER)
+            except (TimeoutError, ConnectionError) as e:
+                reason = "connection"
+                print(f"\n  ⚠ Timeout/Connection error on message {message.id}: {str(e)} (attempt {attempt}/{max_retries})")
+                delay = self._retry_delay(_CONNECTION_RETRY_DELAY, attempt)
+            except Exception as e:
+                reason = "error"
+                print(f"\n  ✗ Error processing message {message.id}: {str(e)} (attempt {attempt}/{max_retries})")
+                delay = self._retry_delay(_RETRY_BASE_DELAY, attempt)
+            
+            if attempt < max_retries:
+                print(f"  ⏳ Waiting {delay:.0f} seconds before retry...")
+                await asyncio.sleep(delay)
+        
+        print(f"\n[{idx}/{total_label}] ✗ FAILED after {max_retries} attempts: message {message.id}")
+        self.failed_count += 1
+        self._notify_progress("failed", current=idx, total=total_files,
+                              filename=file_info[0], reason=reason)
+    
+    async def _attempt_message(self, idx: int, message, file_info: tuple,
+                               total_files: Optional[int], total_label) -> bool:
+        """
+        One pass over a message: skip it, or download it and queue it for the
+        movers (_move_to_drive).
+        
+        Returns:
+            False if the download failed and is worth retrying; True once the
+            message is settled (skipped, or downloaded and handed to the movers)
+        """
+        existing_files = self._existing_files
+        filename, file_size = file_info
+        
+        # Same Telegram file already mirrored (possibly under a conflict-renamed name)?
+        media_id = get_media_id(message)
+        recorded = self._manifest.get(media_id)
+        if recorded and existing_files.get(recorded[0]) == recorded[1]:
+            print(f"\n[{idx}/{total_label}] ⊘ SKIPPED (already mirrored as {recorded[0]}): {filename}")
+            self.skipped_count += 1
+            self.total_size += recorded[1]
+            self._notify_progress("skipped", current=idx, total=total_files, filename=filename)
+            return True
+        
+        # Check if file already exists (resume capability)
+        # Now checks both filename AND size to ensure file is complete
+        if filename in existing_files:
+            existing_size = existing_files[filename]
+            # If file size matches (within 1% tolerance) or file_size is None, skip it
+            if file_size is None or abs(existing_size - file_size) / file_size < 0.01:
+                print(f"\n[{idx}/{total_label}] ⊘ SKIPPED (already exists): {filename}")
+                self.skipped_count += 1
+                if file_size:
+                    self.total_size += file_size
+                self._notify_progress("skipped", current=idx, total=total_files, filename=filename)
+                return True
+            else:
+                # File exists but size doesn't match - might be incomplete, re-download
+                print(f"\n[{idx}/{total_label}] ⚠ File exists but size mismatch - re-downloading: {filename}\n"
+                      f"    Existing: {format_size(existing_size)}, Expected: {format_size(file_size)}")
+        
+        # One write per file header rather than one per line
+        header = f"\n[{idx}/{total_label}] ↓ Downloading: {filename}"
+        if file_size:
+            header += f"\n    Size: {format_size(file_size)}"
+        print(header)
+        
+        self._notify_progress("downloading", current=idx, total=total_files, filename=filename, size=file_size)
+        
+        # Small files go straight into Drive when a temp copy would have to be
+        # copied across filesystems anyway: their bytes are written once, not twice
+        direct_path = None
+        bypass_limit = self.config.small_file_bypass_mb * 1024 * 1024
+        if file_size and file_size < bypass_limit and not self.uploader.moves_are_renames:
+            direct_path = await asyncio.to_thread(self.uploader.claim_file, filename)
+        
+        # Download file
+        try:
+            downloaded_path = await self.downloader.download_file(
+                message, file_info=file_info, dest_path=direct_path
+            )
+        except BaseException:
+            if direct_path:
+                self.uploader.discard_file(direct_path)
+            raise
+        
+        if not downloaded_path or not os.path.exists(downloaded_path):
+            if direct_path:
+                self.uploader.discard_file(direct_path)
+            return False
+        
+        md5 = self.downloader.pop_file_hash(downloaded_path)
+        if direct_path:
+            # Already in Drive: check it and give it its name (no mover needed)
+            await self._move_to_drive(idx, total_files, filename, media_id, downloaded_path, md5,
+                                      in_drive=True, expected_size=file_size)
+        else:
+            # Hand the file to the movers and go on to the next download
+            await self._move_queue.put((idx, total_files, filename, media_id, downloaded_path, md5))
+        
+        # Rate limiting: small delay between files to avoid triggering Telegram limits
+        await asyncio.sleep(1)  # 1 second delay between files
+        return True
+    
+    async def _move_to_drive(self, idx: int, total_files: Optional[int], filename: str,
+                             media_id, downloaded_path: str, md5: Optional[str],
+                             in_drive: bool = False, expected_size: Optional[int] = None):
+        """
+        Move a downloaded file into Drive and record it (mover stage).
+        With in_drive, the file was downloaded straight into an in-progress
+        Drive path (see DriveUploader.claim_file) and is size-checked against
+        expected_size and renamed in place instead.
+        """
+        # Same bytes already mirrored from another message (a re-upload to the
+        # channel gets a new media id)? Point this one at that file instead.
+        duplicate = self._by_md5.get(md5) if md5 else None
+        if duplicate and self._existing_files.get(duplicate[0]) == duplicate[1]:
+            dup_name, dup_size = duplicate
+            if in_drive:
+                self.uploader.discard_file(downloaded_path)
+            else:
+                try:
+                    os.remove(downloaded_path)
+                except OSError:
+                    pass
+            print(f"  ⊘ SKIPPED (identical to {dup_name}): {filename}")
+            self.skipped_count += 1
+            self.total_size += dup_size
+            if media_id is not None:
+                await self._record_manifest(media_id, dup_name, dup_size, md5)
+            self._notify_progress("skipped", current=idx, total=total_files, filename=filename)
+            return
+        
+        if not in_drive:
+            print(f"  ↑ Uploading to Drive: {filename}")
+            self._notify_progress("uploading", current=idx, total=total_files, filename=filename)
+        
+        try:
+            # Move runs in a thread so the event loop (and the downloads) keep going
+            if in_drive:
+                success, final_path, actual_size, md5 = await asyncio.to_thread(
+                    self.uploader.adopt_file, downloaded_path, filename, expected_size, md5
+                )
+            else:
+                success, final_path, actual_size, md5 = await asyncio.to_thread(
+                    self.uploader.upload_file, downloaded_path, filename, md5
+                )
+        except Exception as e:
+            print(f"  ✗ Move failed: {str(e)}")
+            success = False
+            if in_drive:
+                self.uploader.discard_file(downloaded_path)
+        
+        if success:
+            self.downloaded_count += 1
+            self.total_size += actual_size
+            if media_id is not None:
+                final_name = os.path.basename(final_path)
+                await self._record_manifest(media_id, final_name, actual_size, md5)
+            if md5:
+                self._by_md5[md5] = (os.path.basename(final_path), actual_size)
+            print(f"  ✓ Success! {filename} ({format_size(actual_size)})")
+            self._notify_progress("completed", current=idx, total=total_files, filename=filename, size=actual_size)
+        else:
+            # The downloaded copy is gone once the move fails, so don't retry
+            print(f"  ✗ Upload failed: {filename}")
+            self.failed_count += 1
+            self._notify_progress("failed", current=idx, total=total_files, filename=filename, reason="upload")
+    
+    async def _record_manifest(self, media_id, filename: str, size: int, md5: Optional[str]):
+        """Remember a mirrored file; written out once _MANIFEST_BATCH_SIZE have queued up."""
+        self._manifest[media_id] = (filename, size, md5)
+        self._manifest_pending.append((media_id, filename, size, md5))
+        if len(self._manifest_pending) >= _MANIFEST_BATCH_SIZE:
+            await self._flush_manifest()
+    
+    async def _flush_manifest(self):
+        """Append all pending manifest records in one write."""
+        pending, self._manifest_pending = self._manifest_pending, []
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(append_manifest_entries, self.drive_folder_path, pending)
+        except OSError as e:
+            print(f"  ⚠ Could not update mirror manifest: {str(e)}")
+            self._manifest_pending[:0] = pending  # Try again with the next batch
+    
+    @staticmethod
+    def _retry_delay(base: float, attempt: int) -> float:
+        """Backoff before retrying after the given (1-based) failed attempt."""
+        delay = min(base * 2 ** (attempt - 1), _RETRY_MAX_DELAY)
+        return delay + random.uniform(0, delay * _RETRY_JITTER)
+    
     def _print_summary(self, total_files: int):
         """Print processing summary."""
         print("\n" + "=" * 60)
@@ -297,14 +562,14 @@ class MirrorProcessor:
         print(f"Total size: {format_size(self.total_size)}")
         print("=" * 60)
     
-    def cleanup(self):
+    async def cleanup(self):
         """Clean up resources."""
         if self.uploader:
-            drive_folder_path = self.config.get_drive_folder_path()
             self.uploader.cleanup_temp_files(self.config.temp_download_dir, keep_session=True)
             print("\n✓ Cleanup complete")
         
-        if self.client:
-            self.client.disconnect()
+        if self.client and self._owns_client:
+            await self.client.disconnect()
+            self.config.backup_session()
             print("✓ Disconnected from Telegram")
 
@@ -3,49 +3,312 @@ Google Drive uploader module
 """
 
 import os
+import errno
 import shutil
+import threading
 from typing import Optional, Tuple
-from .utils import calculate_file_hash
+from .utils import get_existing_files, new_hash
+
+# Read/write size for the hashed cross-filesystem copy into Drive; large
+# writes keep round trips to a FUSE-mounted Drive few
+_COPY_CHUNK_SIZE = 16 * 1024 * 1024
+# Copies below this size are hashed as they are written (the MD5 is kept in
+# the manifest); larger ones are only size-checked, so they can be copied in the kernel
+_HASH_VERIFY_LIMIT = 100 * 1024 * 1024
+# Copies into Drive are flushed with one os.sync() per this many files (and at
+# the end of a run via sync()) instead of an fsync each, so the Drive client
+# can coalesce uploads. A crash can lose up to this many recent copies, which
+# the next run finds missing or short and downloads again.
+_SYNC_BATCH_SIZE = 25
+# Name suffix of downloads still being written straight into Drive (see
+# claim_file); leftovers from an interrupted run are removed at startup
+_PART_SUFFIX = '.tgmirror-part'
+# Largest count per sendfile() call, and the errors meaning it isn't supported
+# between these two files (rather than a failed copy)
+_SENDFILE_MAX_COUNT = 1 << 30
+_NO_SENDFILE_ERRNOS = frozenset((errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP))
+# os.link() failures meaning "no hard links here" rather than a real error
+_NO_HARDLINK_ERRNOS = frozenset((errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS))
+# Telethon's SQLite session file and its rollback journal
+_SESSION_SUFFIXES = ('.session', '.session-journal')
+
+
+def _drop_cached_pages(fd: int):
+    """
+    Tell the kernel a copied file won't be read again, so its pages can leave
+    the page cache (on Colab that is RAM the downloads can use). Best effort:
+    pages still dirty are kept until written back.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+def _copy_in_kernel(fsrc, fdst):
+    """
+    Copy an open file into another with sendfile(), so the data never passes
+    through a Python buffer; falls back to a buffered copy where the kernel
+    can't sendfile between these two files.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    size = os.fstat(infd).st_size
+    offset = 0
+    if hasattr(os, 'sendfile'):
+        try:
+            while offset < size:
+                sent = os.sendfile(outfd, infd, offset, min(size - offset, _SENDFILE_MAX_COUNT))
+                if not sent:
+                    break  # Source shrank under us: the size check after the move catches it
+                offset += sent
+            return
+        except OSError as e:
+            if offset or e.errno not in _NO_SENDFILE_ERRNOS:
+                raise
+    shutil.copyfileobj(fsrc, fdst, _COPY_CHUNK_SIZE)
+
+
+def _rename_exclusive(src: str, dst: str):
+    """
+    Rename src to dst without replacing an existing dst.
+    A hard link claims dst atomically; on filesystems without hard links (the
+    Drive mount, for one) dst is checked for right before the rename instead.
+    
+    Raises:
+        FileExistsError: If dst already exists
+        OSError: Anything else, e.g. EXDEV when src and dst are on different filesystems
+    """
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in _NO_HARDLINK_ERRNOS:
+            raise
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.replace(src, dst)
+        return
+    os.unlink(src)
 
 
 class DriveUploader:
     """Handles uploading files to Google Drive."""
     
-    def __init__(self, drive_folder_path: str):
+    def __init__(self, drive_folder_path: str, existing_files: Optional[dict] = None,
+                 temp_dir: Optional[str] = None):
         self.drive_folder_path = drive_folder_path
+        # Folder path with its trailing separator, so target paths are one concatenation
+        self._drive_prefix = os.path.join(os.fspath(drive_folder_path), '')
+        # Whether temp files can be renamed into Drive (same filesystem); checked
+        # once here so cross-device setups (local disk -> Drive mount) don't try a
+        # rename per file. None (no temp_dir given) means try and see.
+        self._same_dev: Optional[bool] = None
+        if temp_dir:
+            try:
+                self._same_dev = os.stat(temp_dir).st_dev == os.stat(drive_folder_path).st_dev
+            except OSError:
+                pass
+        # {filename: size} snapshot of the Drive folder, kept current as files are
+        # moved in, so conflict checks never stat the (slow, network-backed) mount
+        if existing_files is None:
+            existing_files = get_existing_files(drive_folder_path)
+        # Downloads a killed run left half-written in Drive
+        for name in [name for name in existing_files if name.endswith(_PART_SUFFIX)]:
+            try:
+                os.remove(self._drive_prefix + name)
+            except OSError:
+                pass
+            del existing_files[name]
+        self.existing_files = existing_files
+        # Names picked for moves still in flight; kept out of existing_files so
+        # skip checks there only ever see real sizes
+        self._reserved = set()
+        self._names_lock = threading.Lock()
+        self._unsynced = 0  # Copies made since the last sync()
+    
+    def _reserve_name(self, filename: str) -> str:
+        """
+        Pick a free name in the Drive folder and reserve it.
+        Uploads run in worker threads, so the pick and the reservation happen
+        under one lock. Settle the reservation with _release_name().
+        """
+        name, ext = os.path.splitext(filename)
+        candidate = filename
+        counter = 1
+        with self._names_lock:
+            while candidate in self.existing_files or candidate in self._reserved:
+                candidate = f"{name}_{counter}{ext}"
+                counter += 1
+            self._reserved.add(candidate)
+        return candidate
+    
+    def _release_name(self, drive_name: str, size: Optional[int] = None):
+        """
+        Drop a _reserve_name() reservation, recording the file's size when one
+        now exists under that name.
+        """
+        with self._names_lock:
+            self._reserved.discard(drive_name)
+            if size is not None:
+                self.existing_files[drive_name] = size
     
-    def upload_file(self, temp_file_path: str, filename: str) -> Tuple[bool, Optional[str]]:
+    @property
+    def moves_are_renames(self) -> bool:
+        """Whether temp files are known to reach Drive by a (free) rename rather than a copy."""
+        return self._same_dev is True
+    
+    def claim_file(self, filename: str) -> str:
+        """
+        Create an empty in-progress file in the Drive folder, for a download
+        written straight into Drive (no temp copy to move). It carries
+        _PART_SUFFIX until adopt_file() has checked it and renamed it to its
+        real name, so an interrupted download never looks like a finished file.
+        
+        Returns:
+            Path of the claimed in-progress file; settle it with adopt_file()
+            or discard_file()
+        """
+        counter = 0
+        while True:
+            part_name = f"{filename}.{counter}{_PART_SUFFIX}" if counter else filename + _PART_SUFFIX
+            part_path = self._drive_prefix + part_name
+            try:
+                fd = os.open(part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                counter += 1  # Same name downloading concurrently
+                continue
+            os.close(fd)
+            return part_path
+    
+    def adopt_file(self, part_path: str, filename: str, expected_size: Optional[int],
+                   md5: Optional[str] = None) -> Tuple[bool, Optional[str], Optional[int], Optional[str]]:
+        """
+        Check a download written into a claim_file() path and rename it to a
+        free name in the Drive folder.
+        
+        Args:
+            part_path: Path returned by claim_file()
+            filename: Target filename in Drive
+            expected_size: Size the download must have (None to skip the check)
+            md5: MD5 of the file if known
+        
+        Returns:
+            tuple: (success, final_path, size, md5) like upload_file; the
+            in-progress file is removed when this fails
+        """
+        try:
+            size = os.path.getsize(part_path)
+        except OSError:
+            size = None
+        if size is None or (expected_size is not None and size != expected_size):
+            print(f"  ✗ Verification failed: Size mismatch (expected: {expected_size}, got: {size})")
+            self.discard_file(part_path)
+            return False, None, None, None
+        
+        while True:
+            drive_name = self._reserve_name(filename)
+            drive_file_path = self._drive_prefix + drive_name
+            try:
+                _rename_exclusive(part_path, drive_file_path)
+                break
+            except FileExistsError:
+                self._mark_taken(drive_name, drive_file_path)
+            except OSError as e:
+                print(f"  ✗ Move failed: {str(e)}")
+                self._release_name(drive_name)
+                self.discard_file(part_path)
+                return False, None, None, None
+        
+        self._release_name(drive_name, size)
+        return True, drive_file_path, size, md5
+    
+    @staticmethod
+    def discard_file(part_path: str):
+        """Remove a claim_file() path (e.g. a failed or duplicate download)."""
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+    
+    def _mark_taken(self, drive_name: str, drive_file_path: str):
+        """
+        Record a name found taken in Drive after our snapshot (e.g. by another
+        mirror session), so the next pick moves on past it. If it can't be
+        stat'ed, the name just stays reserved.
+        """
+        try:
+            self._release_name(drive_name, os.stat(drive_file_path).st_size)
+        except OSError:
+            pass
+    
+    def upload_file(self, temp_file_path: str, filename: str,
+                    md5: Optional[str] = None) -> Tuple[bool, Optional[str], Optional[int], Optional[str]]:
         """
         Move file from temp directory to Drive and verify.
         
         Args:
             temp_file_path: Path to temporary file
             filename: Target filename in Drive
+            md5: MD5 of the temp file if already known (e.g. hashed while it was
+                downloaded); the copy then needn't hash it again
             
         Returns:
-            tuple: (success: bool, final_path: Optional[str])
+            tuple: (success: bool, final_path: Optional[str], size: Optional[int],
+            md5: Optional[str]), size being the verified size of the file in Drive
+            and md5 its hash (None when it wasn't computed)
         """
         # Handle filename conflicts in Drive
-        drive_file_path = os.path.join(self.drive_folder_path, filename)
-        counter = 1
-        original_path = drive_file_path
-        while os.path.exists(drive_file_path):
-            name, ext = os.path.splitext(filename)
-            drive_file_path = os.path.join(self.drive_folder_path, f"{name}_{counter}{ext}")
-            counter += 1
+        while True:
+            drive_name = self._reserve_name(filename)
+            drive_file_path = self._drive_prefix + drive_name
+            try:
+                dest_size, md5 = self._move_and_verify(temp_file_path, drive_file_path, md5)
+                break
+            except FileExistsError:
+                # Created in Drive after our snapshot: try the next name
+                self._mark_taken(drive_name, drive_file_path)
+        
+        self._release_name(drive_name, dest_size)
+        if dest_size is None:
+            return False, None, None, None
+        return True, drive_file_path, dest_size, md5
+    
+    def _move_and_verify(self, temp_file_path: str, drive_file_path: str,
+                         known_md5: Optional[str] = None) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Move a file to its reserved Drive path and verify its size.
         
+        Returns:
+            tuple: (size, md5) of the file in Drive - size None if the move
+            failed verification, md5 None unless it was known or hashed while copied
+            
+        Raises:
+            FileExistsError: If a copy finds drive_file_path already taken
+        """
         try:
-            # Calculate hash before move for integrity verification
-            source_hash = calculate_file_hash(temp_file_path, 'md5')
             source_size = os.path.getsize(temp_file_path)
             
-            # Move the file
-            shutil.move(temp_file_path, drive_file_path)
+            # Move the file: a rename when temp and Drive share a filesystem,
+            # otherwise a copy (hashed on the way through below _HASH_VERIFY_LIMIT,
+            # unless the hash is already known - then the kernel copies it)
+            copied, source_hash = self._move_file(
+                temp_file_path, drive_file_path,
+                known_md5 is None and source_size < _HASH_VERIFY_LIMIT,
+                try_rename=self._same_dev is not False
+            )
+            source_hash = known_md5 or source_hash
+            if not copied:
+                return source_size, source_hash  # Renamed in place: atomic, nothing was copied to verify
+            self._note_copied()
             
-            # Verify the move was successful and file integrity
-            if os.path.exists(drive_file_path):
+            # Verify the move was successful. The hash was taken from the very bytes
+            # written, so the copy is not read back to re-hash it
+            try:
                 dest_size = os.path.getsize(drive_file_path)
-                
+            except FileNotFoundError:
+                dest_size = None
+            
+            if dest_size is not None:
                 # Check size matches
                 if dest_size != source_size:
                     print(f"  ✗ Verification failed: Size mismatch (source: {source_size}, dest: {dest_size})")
@@ -54,29 +317,14 @@ class DriveUploader:
                         os.remove(drive_file_path)
                     except:
                         pass
-                    return False, None
+                    return None, None
                 
-                # Verify file integrity with hash (for files < 100MB to avoid long delays)
-                if source_size < 100 * 1024 * 1024 and source_hash:
-                    dest_hash = calculate_file_hash(drive_file_path, 'md5')
-                    if dest_hash != source_hash:
-                        print(f"  ✗ Verification failed: File integrity check failed (hash mismatch)")
-                        try:
-                            os.remove(drive_file_path)
-                        except:
-                            pass
-                        return False, None
-                
-                # Ensure temp file is deleted
-                if os.path.exists(temp_file_path):
-                    try:
-                        os.remove(temp_file_path)
-                    except:
-                        pass
-                return True, drive_file_path
+                return dest_size, source_hash
             else:
                 print(f"  ✗ Verification failed: File not found in Drive after move")
-                return False, None
+                return None, None
+        except FileExistsError:
+            raise  # Temp file untouched; the caller retries under another name
         except Exception as e:
             print(f"  ✗ Move failed: {str(e)}")
             # Clean up temp file if move failed
@@ -85,21 +333,108 @@ class DriveUploader:
                     os.remove(temp_file_path)
                 except:
                     pass
-            return False, None
+            return None, None
+    
+    @staticmethod
+    def _move_file(src: str, dst: str, with_hash: bool,
+                   try_rename: bool = True) -> Tuple[bool, Optional[str]]:
+        """
+        Move src to dst without reading the data more than once.
+        
+        Args:
+            src: Source file path
+            dst: Destination file path
+            with_hash: Whether a copy should compute the MD5 of what it writes
+            try_rename: False when src and dst are known to be on different
+                filesystems, to go straight to the copy
+            
+        Returns:
+            tuple: (copied: bool, md5: Optional[str]) - (False, None) for a
+            same-filesystem rename, since nothing was copied to verify
+        """
+        if try_rename:
+            try:
+                _rename_exclusive(src, dst)
+                return False, None
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Cross-device (local temp -> mounted Drive): copy it
+        
+        # Exclusive create claims dst atomically, so a file that appeared in Drive
+        # since the folder snapshot is never overwritten (raises FileExistsError)
+        fdst = open(dst, 'xb')
+        source_hash = None
+        try:
+            with open(src, 'rb', buffering=0) as fsrc, fdst:
+                if hasattr(os, 'posix_fadvise'):
+                    # One front-to-back pass: let the kernel read ahead aggressively
+                    os.posix_fadvise(fsrc.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                if with_hash:
+                    # Hashing needs the bytes in userspace: one streaming read-hash-write pass
+                    # through one reused buffer (no per-chunk bytes objects)
+                    hash_obj = new_hash('md5')
+                    buf = bytearray(min(_COPY_CHUNK_SIZE, max(os.fstat(fsrc.fileno()).st_size, 1)))
+                    view = memoryview(buf)
+                    while True:
+                        n = fsrc.readinto(buf)
+                        if not n:
+                            break
+                        hash_obj.update(view[:n])
+                        fdst.write(view[:n])  # Larger than the writer's buffer: written straight through
+                    source_hash = hash_obj.hexdigest()
+                else:
+                    # No hash wanted: the kernel copies it, never through a Python buffer
+                    _copy_in_kernel(fsrc, fdst)
+                # No fsync here: copies are synced in batches (see _note_copied)
+                fdst.flush()
+                # Neither side is read again: let both leave the page cache
+                _drop_cached_pages(fsrc.fileno())
+                _drop_cached_pages(fdst.fileno())
+            shutil.copystat(src, dst)
+        except BaseException:
+            # Don't leave a partial copy behind in Drive
+            fdst.close()
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+            raise
+        os.remove(src)
+        return True, source_hash
+    
+    def _note_copied(self):
+        """Count a finished copy; sync once _SYNC_BATCH_SIZE have piled up."""
+        with self._names_lock:
+            self._unsynced += 1
+            due = self._unsynced >= _SYNC_BATCH_SIZE
+        if due:
+            self.sync()
+    
+    def sync(self):
+        """Flush all copies made so far out to the Drive filesystem in one call."""
+        with self._names_lock:
+            pending, self._unsynced = self._unsynced, 0
+        if pending and hasattr(os, 'sync'):
+            os.sync()
     
     def cleanup_temp_files(self, temp_dir: str, keep_session: bool = True):
         """Clean up temporary files in the download directory."""
-        if not os.path.exists(temp_dir):
+        # scandir: is_file() comes from the directory listing, no stat per entry
+        keep_suffixes = _SESSION_SUFFIXES if keep_session else ()
+        errors = []
+        try:
+            with os.scandir(temp_dir) as entries:
+                for entry in entries:
+                    # Keep session files (and their journals) if requested
+                    if entry.name.endswith(keep_suffixes) or not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        os.unlink(entry.path)
+                    except OSError as e:
+                        errors.append(f"  ⚠ Could not remove {entry.name}: {str(e)}")
+        except FileNotFoundError:
             return
         
-        for file in os.listdir(temp_dir):
-            file_path = os.path.join(temp_dir, file)
-            if os.path.isfile(file_path):
-                # Keep session files if requested
-                if keep_session and file.endswith('.session'):
-                    continue
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"  ⚠ Could not remove {file}: {str(e)}")
-
+        if errors:
+            print("\n".join(errors))
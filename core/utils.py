@@ -3,8 +3,61 @@ Utility functions for the mirror script
 """
 
 import os
+import re
+import json
+import mmap
 import hashlib
-from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+import functools
+from typing import Optional
+from telethon.tl.types import (
+    MessageMediaDocument, MessageMediaPhoto, Document, Photo, DocumentAttributeFilename
+)
+
+# Optional: list the Drive folder through the Drive API instead of the FUSE mount
+try:
+    import google.auth
+    from googleapiclient.discovery import build as _build_drive_service
+except ImportError:
+    _build_drive_service = None
+try:
+    from google.colab import auth as _colab_auth
+except ImportError:
+    _colab_auth = None
+
+
+# Files at least this big are hashed from an mmap in one update() call;
+# below it the mapping setup costs more than the read loop it replaces
+_HASH_MMAP_MIN_SIZE = 10 * 1024 * 1024
+# Read sizes below the mmap threshold (and for unmappable files): small files
+# fit in one 64 KiB read, the rest go 1 MiB at a time
+_HASH_SMALL_FILE_SIZE = 1 << 20
+_HASH_SMALL_CHUNK_SIZE = 1 << 16
+_HASH_CHUNK_SIZE = 1 << 20
+
+# Hash constructors bound once, so creating a hasher is a single call
+_HASH_CONSTRUCTORS = {
+    'md5': functools.partial(hashlib.md5, usedforsecurity=False),
+    'sha256': functools.partial(hashlib.sha256, usedforsecurity=False),
+}
+
+# @name, name, t.me/name (optionally /s/ or a trailing /<post id>), tg://resolve?domain=name
+_CHANNEL_LINK_RE = re.compile(
+    r'^(?:(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me)/(?:s/)?|tg://resolve\?domain=|@)?'
+    r'(?P<name>[A-Za-z]\w{3,31})(?:/\d+)?/?$'
+)
+
+
+def clean_channel_link(link: str):
+    """
+    Normalize a user-supplied channel reference to '@username'.
+    
+    Returns:
+        str: '@username', or None if the input is not a valid public channel link
+    """
+    match = _CHANNEL_LINK_RE.match(link.strip())
+    if not match:
+        return None
+    return '@' + match.group('name')
 
 
 def has_media(message) -> bool:
@@ -21,19 +74,20 @@ def get_file_info(message):
     """
     if isinstance(message.media, MessageMediaDocument):
         doc = message.media.document
-        # Get filename from attributes or use default
-        filename = None
-        for attr in doc.attributes:
-            if hasattr(attr, 'file_name'):
-                filename = attr.file_name
-                break
+        if not isinstance(doc, Document):
+            return None, None  # Missing or expired (DocumentEmpty) - nothing to download
+        # Get filename from attributes or use default (first filename attribute wins)
+        filename = next(
+            (attr.file_name for attr in doc.attributes if type(attr) is DocumentAttributeFilename),
+            None
+        )
         
         if not filename:
             # Generate filename from document ID
             filename = f"document_{doc.id}"
-            # Try to get extension from mime type
+            # Try to get extension from mime type (the subtype, as earlier mirrors named it)
             if doc.mime_type:
-                ext = doc.mime_type.split('/')[-1]
+                ext = doc.mime_type.rpartition('/')[2]
                 if ext:
                     filename += f".{ext}"
         
@@ -43,6 +97,8 @@ def get_file_info(message):
     elif isinstance(message.media, MessageMediaPhoto):
         # For photos, generate a filename
         photo = message.media.photo
+        if not isinstance(photo, Photo):
+            return None, None  # Missing or expired (PhotoEmpty)
         filename = f"photo_{photo.id}.jpg"
         file_size = None  # Photo size not always available
         return filename, file_size
@@ -50,17 +106,17 @@ def get_file_info(message):
     return None, None
 
 
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
+
 def format_size(size_bytes) -> str:
     """Format file size in human-readable format."""
     if size_bytes is None:
         return "Unknown"
     
-    size = float(size_bytes)
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if size < 1024.0:
-            return f"{size:.2f} {unit}"
-        size /= 1024.0
-    return f"{size:.2f} PB"
+    # Unit index straight from the bit length: each unit is 10 more bits
+    i = min(max(abs(int(size_bytes)).bit_length() - 1, 0), 59) // 10
+    return f"{size_bytes / (1 << (i * 10)):.2f} {_SIZE_UNITS[i]}"
 
 
 def setup_directories(*paths):
@@ -69,41 +125,301 @@ def setup_directories(*paths):
         os.makedirs(path, exist_ok=True)
 
 
-def get_existing_files(drive_folder_path) -> dict:
+# Per-folder record of mirrored media, one JSON object per line
+MANIFEST_FILENAME = '.tg_mirror_manifest.jsonl'
+# Per-folder {channel peer id: highest message id mirrored} for incremental runs
+STATE_FILENAME = '.tg_mirror_state.json'
+# Our own bookkeeping files, never mistaken for mirrored media
+_META_FILENAMES = frozenset((MANIFEST_FILENAME, STATE_FILENAME))
+
+
+def get_media_id(message):
+    """
+    Get Telegram's id for a message's document or photo.
+    
+    Returns:
+        int: Media id (stable across re-posts of the same file) or None
+    """
+    media = message.media
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return media.document.id
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return media.photo.id
+    return None
+
+
+def load_manifest(drive_folder_path) -> dict:
+    """
+    Load the record of media already mirrored into a Drive folder.
+    
+    Returns:
+        dict: {media_id: (filename, file_size, md5)} mapping, later entries win;
+        md5 is None for entries recorded without a hash
+    """
+    manifest = {}
+    manifest_path = os.path.join(drive_folder_path, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    manifest[entry['id']] = (entry['name'], entry['size'], entry.get('md5'))
+                except (ValueError, KeyError, TypeError):
+                    continue  # Torn line from an interrupted run
+    except FileNotFoundError:
+        pass
+    return manifest
+
+
+def append_manifest_entries(drive_folder_path, entries):
+    """
+    Record several mirrored files with one open/write/close of the manifest.
+    On the Drive mount every close of a changed file syncs it, so batching
+    entries saves a round trip per file.
+    
+    Args:
+        drive_folder_path: Drive folder holding the manifest
+        entries: Iterable of (media_id, filename, file_size, md5) tuples
+    """
+    lines = []
+    for media_id, filename, file_size, md5 in entries:
+        record = {'id': media_id, 'name': filename, 'size': file_size}
+        if md5:
+            record['md5'] = md5  # Hash of the bytes written, when the copy computed one
+        lines.append(json.dumps(record) + '\n')
+    if not lines:
+        return
+    manifest_path = os.path.join(drive_folder_path, MANIFEST_FILENAME)
+    with open(manifest_path, 'a', encoding='utf-8') as f:
+        f.write(''.join(lines))
+
+
+def load_last_message_id(drive_folder_path, channel_key: str) -> int:
+    """
+    Highest message id a previous clean run mirrored from a channel into this folder.
+    
+    Returns:
+        int: The message id, or 0 if there is no record
+    """
+    try:
+        with open(os.path.join(drive_folder_path, STATE_FILENAME), encoding='utf-8') as f:
+            return int(json.load(f).get(channel_key, 0))
+    except (OSError, ValueError, TypeError, AttributeError):
+        return 0
+
+
+def save_last_message_id(drive_folder_path, channel_key: str, message_id: int):
+    """Record the highest message id mirrored from a channel (see load_last_message_id)."""
+    state_path = os.path.join(drive_folder_path, STATE_FILENAME)
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if not isinstance(state, dict):
+            state = {}
+    except (OSError, ValueError):
+        state = {}
+    state[channel_key] = message_id
+    # Write a sibling and rename over, so an interrupted write never loses the record
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+_DRIVE_FOLDER_MIME = 'application/vnd.google-apps.folder'
+_DRIVE_LIST_PAGE_SIZE = 1000
+_DRIVE_SCOPE = 'https://www.googleapis.com/auth/drive'
+_DRIVE_SCOPE_READONLY = 'https://www.googleapis.com/auth/drive.readonly'
+
+
+def drive_api_client(readonly: bool = True):
+    """
+    Build a Drive v3 service from the default credentials.
+    
+    Args:
+        readonly: Ask only for read access (enough for listing)
+    
+    Returns:
+        The service, or None if google-api-python-client or credentials are unavailable
+    """
+    if _build_drive_service is None:
+        return None
+    try:
+        if _colab_auth is not None:
+            _colab_auth.authenticate_user()
+        credentials, _ = google.auth.default(
+            scopes=[_DRIVE_SCOPE_READONLY if readonly else _DRIVE_SCOPE]
+        )
+        return _build_drive_service('drive', 'v3', credentials=credentials, cache_discovery=False)
+    except Exception as e:
+        print(f"⚠️ Drive API unavailable: {str(e)}")
+        return None
+
+
+def _drive_query_literal(value: str) -> str:
+    """Quote a string for a Drive API search query."""
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def _find_drive_folder_id(files, folder_path: str) -> Optional[str]:
+    """Resolve a folder path relative to My Drive to its id, one path component at a time."""
+    folder_id = 'root'
+    for part in folder_path.strip('/').split('/'):
+        if not part:
+            continue
+        found = files.list(
+            q=f"name={_drive_query_literal(part)} and mimeType='{_DRIVE_FOLDER_MIME}' "
+              f"and '{folder_id}' in parents and trashed=false",
+            fields='files(id)', pageSize=1
+        ).execute().get('files')
+        if not found:
+            return None
+        folder_id = found[0]['id']
+    return folder_id
+
+
+def update_drive_folder_metadata(service, folder_path: str, metadata: dict) -> bool:
+    """
+    Apply metadata (e.g. description, folderColorRgb) to a My Drive folder.
+    Every field goes in one files.update PATCH, so setup costs a single write
+    however many fields are set.
+    
+    Args:
+        service: Drive v3 service from drive_api_client(readonly=False)
+        folder_path: Folder path relative to My Drive
+        metadata: Drive file resource fields to set
+        
+    Returns:
+        bool: True if the folder was found and updated
+    """
+    files = service.files()
+    try:
+        folder_id = _find_drive_folder_id(files, folder_path)
+        if folder_id is None:
+            print(f"⚠️ Drive folder not found via the API: {folder_path}")
+            return False
+        files.update(fileId=folder_id, body=metadata, fields='id').execute()
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not update Drive folder metadata: {str(e)}")
+        return False
+
+
+def list_drive_folder(service, folder_path: str) -> Optional[dict]:
+    """
+    List a My Drive folder with files.list queries instead of the FUSE mount.
+    
+    Args:
+        service: Drive v3 service from drive_api_client()
+        folder_path: Folder path relative to My Drive (e.g. 'Telegram_Mirror')
+        
+    Returns:
+        dict: {filename: file_size} like get_existing_files, or None if the
+        folder couldn't be found or listed
+    """
+    files = service.files()
+    try:
+        folder_id = _find_drive_folder_id(files, folder_path)
+        if folder_id is None:
+            return None
+        
+        # One paged query for the whole folder replaces a readdir + stat per file
+        existing_files = {}
+        page_token = None
+        while True:
+            page = files.list(
+                q=f"'{folder_id}' in parents and trashed=false and mimeType!='{_DRIVE_FOLDER_MIME}'",
+                fields='nextPageToken, files(name, size)',
+                pageSize=_DRIVE_LIST_PAGE_SIZE, pageToken=page_token
+            ).execute()
+            for item in page.get('files', ()):
+                if item['name'] not in _META_FILENAMES:
+                    existing_files[item['name']] = int(item.get('size', 0))
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return existing_files
+    except Exception as e:
+        print(f"⚠️ Drive API listing failed: {str(e)}")
+        return None
+
+
+def get_existing_files(drive_folder_path, drive_api_folder: Optional[str] = None) -> dict:
     """
     Get a dict of existing files in the Drive folder for resume capability.
     
+    Args:
+        drive_folder_path: Drive folder path on the mount
+        drive_api_folder: The same folder relative to My Drive; when given, it is
+            listed through the Drive API first, falling back to the mount
+    
     Returns:
         dict: {filename: file_size} mapping for files that exist
     """
+    if drive_api_folder:
+        service = drive_api_client()
+        if service is not None:
+            existing_files = list_drive_folder(service, drive_api_folder)
+            if existing_files is not None:
+                return existing_files
+    
     existing_files = {}
-    if os.path.exists(drive_folder_path):
-        for file in os.listdir(drive_folder_path):
-            file_path = os.path.join(drive_folder_path, file)
-            if os.path.isfile(file_path):
-                file_size = os.path.getsize(file_path)
-                existing_files[file] = file_size
+    try:
+        # One directory read; is_file() comes from the listing, so only sizes cost a
+        # stat (and DirEntry caches that stat on POSIX)
+        with os.scandir(drive_folder_path) as entries:
+            for entry in entries:
+                if entry.name not in _META_FILENAMES and entry.is_file():
+                    existing_files[entry.name] = entry.stat().st_size
+    except FileNotFoundError:
+        pass
     return existing_files
 
 
-def resolve_filename_conflict(base_path, filename):
+def resolve_filename_conflict(base_path, filename, used: Optional[set] = None):
     """
     Resolve filename conflicts by appending numbers.
     
+    Args:
+        base_path: Folder the file will be placed in
+        filename: Desired filename
+        used: Optional set of names already handed out for base_path; names in it
+            count as taken even before their files exist, and the chosen name is
+            added to it
+    
     Returns:
         str: Path to file without conflicts
     """
-    if not os.path.exists(os.path.join(base_path, filename)):
-        return os.path.join(base_path, filename)
+    def taken(candidate):
+        if used is not None and candidate in used:
+            return True
+        return os.path.exists(os.path.join(base_path, candidate))
     
     name, ext = os.path.splitext(filename)
+    candidate = filename
     counter = 1
-    while True:
-        new_filename = f"{name}_{counter}{ext}"
-        new_path = os.path.join(base_path, new_filename)
-        if not os.path.exists(new_path):
-            return new_path
+    while taken(candidate):
+        candidate = f"{name}_{counter}{ext}"
         counter += 1
+    
+    if used is not None:
+        used.add(candidate)
+    return os.path.join(base_path, candidate)
+
+
+def new_hash(algorithm: str = 'md5'):
+    """
+    Create a hash object for integrity checks (not security).
+    usedforsecurity=False keeps OpenSSL on its plain (SHA-NI/SIMD capable)
+    implementation instead of a FIPS-wrapped one, and keeps MD5 usable on
+    FIPS-restricted builds.
+    
+    Raises:
+        ValueError: If algorithm is not 'md5' or 'sha256'
+    """
+    try:
+        return _HASH_CONSTRUCTORS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}") from None
 
 
 def calculate_file_hash(file_path: str, algorithm: str = 'md5') -> str:
@@ -115,15 +431,36 @@ def calculate_file_hash(file_path: str, algorithm: str = 'md5') -> str:
         algorithm: Hash algorithm ('md5' or 'sha256')
         
     Returns:
-        str: Hexadecimal hash of the file
+        str: Hexadecimal hash of the file, or None if it could not be read
+        
+    Raises:
+        ValueError: If algorithm is not 'md5' or 'sha256'
     """
-    hash_obj = hashlib.md5() if algorithm == 'md5' else hashlib.sha256()
+    hash_obj = new_hash(algorithm)
     
     try:
         with open(file_path, 'rb') as f:
-            # Read file in chunks to handle large files
-            for chunk in iter(lambda: f.read(8192), b''):
-                hash_obj.update(chunk)
+            size = os.fstat(f.fileno()).st_size
+            mapped = False
+            if size >= _HASH_MMAP_MIN_SIZE:
+                try:
+                    # Hand the whole mapping to OpenSSL: no Python-level loop or copies
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        if hasattr(mm, 'madvise'):
+                            mm.madvise(mmap.MADV_SEQUENTIAL)
+                        hash_obj.update(mm)
+                    mapped = True
+                except (OSError, ValueError):
+                    pass  # Not mappable (e.g. some FUSE mounts): read it instead
+            if not mapped:
+                # Read file in chunks into one reused buffer (no bytes object per chunk)
+                buf = bytearray(_HASH_SMALL_CHUNK_SIZE if size < _HASH_SMALL_FILE_SIZE else _HASH_CHUNK_SIZE)
+                view = memoryview(buf)
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    hash_obj.update(view[:n])
         return hash_obj.hexdigest()
     except Exception as e:
         return None
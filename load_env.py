@@ -34,34 +34,40 @@ def load_env(env_file: str = '.env') -> bool:
         print(f"⚠ {env_file} file not found. Using environment variables or prompts.")
         return False
     
-    print(f"📄 Loading environment from {env_file}...")
+    lines = [f"📄 Loading environment from {env_file}..."]
+    
+    # Snapshot of names already set; the first definition of a key wins
+    existing = set(os.environ)
     
     with open(env_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            
-            # Skip empty lines and comments
-            if not line or line.startswith('#'):
-                continue
-            
-            # Parse KEY=VALUE
-            if '=' in line:
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                # Remove quotes if present
-                if value.startswith('"') and value.endswith('"'):
-                    value = value[1:-1]
-                elif value.startswith("'") and value.endswith("'"):
-                    value = value[1:-1]
-                
-                # Only set if not already in environment
-                if key and value and key not in os.environ:
-                    os.environ[key] = value
-                    print(f"  ✓ {key} = {'*' * min(len(value), 20)}")
+        data = f.read()
+    
+    for line in data.splitlines():
+        line = line.strip()
+        
+        # Skip empty lines and comments
+        if not line or line[0] == '#':
+            continue
+        
+        # Parse KEY=VALUE
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+        key = key.strip()
+        value = value.strip()
+        
+        # Remove quotes if present
+        if len(value) >= 2 and value[0] in '"\'' and value[-1] == value[0]:
+            value = value[1:-1]
+        
+        # Only set if not already in environment
+        if key and value and key not in existing:
+            os.environ[key] = value
+            existing.add(key)
+            lines.append(f"  ✓ {key} = {'*' * min(len(value), 20)}")
     
-    print("✓ Environment loaded from .env file")
+    lines.append("✓ Environment loaded from .env file")
+    print("\n".join(lines))
     return True
 
 
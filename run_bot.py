@@ -14,6 +14,16 @@ Or use load_env.py to load from .env file
 
 import os
 import sys
+import asyncio
+import traceback
+
+# Use uvloop's faster event loop if available (must happen before the bot
+# client is created so Pyrogram and Telethon both run on it)
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass  # uvloop is optional (not available on Windows)
 
 # Try to load from .env file if it exists
 try:
@@ -65,8 +75,14 @@ def main():
         print("\n⚠ Bot stopped by user")
     except Exception as e:
         print(f"\n✗ Fatal error: {str(e)}")
-        import traceback
         traceback.print_exc()
+    finally:
+        # Cancel any running mirror, disconnect the shared Telethon client and
+        # back its session up to Drive, on the loop run() used (left open by it)
+        try:
+            asyncio.get_event_loop().run_until_complete(bot.stop())
+        except Exception as e:
+            print(f"⚠️ Error during shutdown: {str(e)}")
 
 
 if __name__ == "__main__":
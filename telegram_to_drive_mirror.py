@@ -16,6 +16,8 @@ License: MIT
 
 import os
 import sys
+import asyncio
+import traceback
 
 # Try to load from .env file if it exists
 try:
@@ -26,6 +28,7 @@ except ImportError:
 
 from core.config import Config
 from core.processor import MirrorProcessor
+from core.utils import clean_channel_link
 
 
 def get_user_inputs(config: Config):
@@ -58,11 +61,11 @@ def get_user_inputs(config: Config):
     if not config.channel_link:
         channel_link = input("Enter the Telegram Channel Link (e.g., @channelname or https://t.me/channelname): ").strip()
         # Clean channel link
-        if channel_link.startswith('https://t.me/'):
-            channel_link = '@' + channel_link.split('/')[-1]
-        elif not channel_link.startswith('@'):
-            channel_link = '@' + channel_link
-        config.channel_link = channel_link
+        cleaned = clean_channel_link(channel_link)
+        if not cleaned:
+            print(f"✗ Error: Not a valid channel link: {channel_link}")
+            return False
+        config.channel_link = cleaned
     
     if not config.folder_name:
         folder_name = input("Enter the target folder name in Google Drive (will be created if it doesn't exist): ").strip()
@@ -76,6 +79,24 @@ def get_user_inputs(config: Config):
     return True
 
 
+async def run(config: Config):
+    """Initialize the processor and mirror the channel on a single event loop."""
+    processor = MirrorProcessor(config)
+    
+    try:
+        if not await processor.initialize():
+            print("✗ Failed to initialize. Exiting.")
+            return
+        
+        await processor.process_channel()
+        
+    except Exception as e:
+        print(f"\n✗ Fatal error: {str(e)}")
+        traceback.print_exc()
+    finally:
+        await processor.cleanup()
+
+
 def main():
     """Main execution function."""
     config = Config()
@@ -91,23 +112,10 @@ def main():
         return
     
     # Create processor and run
-    processor = MirrorProcessor(config)
-    
     try:
-        if not processor.initialize():
-            print("✗ Failed to initialize. Exiting.")
-            return
-        
-        processor.process_channel()
-        
+        asyncio.run(run(config))
     except KeyboardInterrupt:
         print("\n\n⚠ Interrupted by user")
-    except Exception as e:
-        print(f"\n✗ Fatal error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        processor.cleanup()
 
 
 if __name__ == "__main__":